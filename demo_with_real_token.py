@@ -4,13 +4,17 @@ Demo script to test FCM push notifications with real token
 This script will help you test the complete flow
 """
 
-import requests
+from _testlib import make_session
 import json
 import time
 
 # Configuration
 SERVER_URL = "http://localhost:5000"
 
+# Shared session so repeated calls reuse the same keep-alive connection;
+# pool size and retries are configured once in _testlib
+SESSION = make_session()
+
 def test_with_real_token():
     """Test the FCM system with a real token"""
     
@@ -102,8 +106,8 @@ curl -X POST http://localhost:5000/send-notification \\
 def register_device(fcm_token, device_id):
     """Register device with server"""
     try:
-        response = requests.post(f"{SERVER_URL}/register-device", 
-                               json={"fcm_token": fcm_token, "device_id": device_id})
+        response = SESSION.post(f"{SERVER_URL}/register-device", 
+                              json={"fcm_token": fcm_token, "device_id": device_id})
         if response.status_code == 200:
             data = response.json()
             print(f"✅ Device '{device_id}' registered successfully")
@@ -118,8 +122,8 @@ def register_device(fcm_token, device_id):
 def send_notification(notification_id, target_token):
     """Send notification via server"""
     try:
-        response = requests.post(f"{SERVER_URL}/send-notification",
-                               json={"notification_id": notification_id, "target_token": target_token})
+        response = SESSION.post(f"{SERVER_URL}/send-notification",
+                              json={"notification_id": notification_id, "target_token": target_token})
         if response.status_code == 200:
             data = response.json()
             print(f"📤 Notification sent - Success: {data['successful_sends']}, Failed: {data['failed_sends']}")
@@ -152,7 +156,7 @@ def test_real_token(real_token):
 def check_server_status():
     """Check if server is running"""
     try:
-        response = requests.get(f"{SERVER_URL}/")
+        response = SESSION.get(f"{SERVER_URL}/")
         if response.status_code == 200:
             data = response.json()
             print(f"✅ Server running - Firebase: {data['firebase_status']}")
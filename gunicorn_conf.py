@@ -0,0 +1,25 @@
+"""
+Gunicorn configuration for running app_with_postgres in production:
+
+    gunicorn -c gunicorn_conf.py app_with_postgres:app
+"""
+
+import os
+
+# Bind address (same port as the Flask dev server)
+bind = f"0.0.0.0:{os.getenv('FLASK_PORT', '5000')}"
+
+# Threaded workers overlap the FCM and database I/O of concurrent requests
+worker_class = 'gthread'
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+
+# FCM multicast sends can take a while for large device lists
+timeout = 60
+
+# Idle keep-alive connections are held this many seconds (gunicorn's default is 2),
+# so clients pausing between requests reuse their socket instead of reconnecting
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '30'))
+
+# Each worker process has its own connection pool; one connection per thread is enough
+os.environ.setdefault('DB_POOL_MAX_SIZE', str(threads))
@@ -7,20 +7,84 @@ Advanced machine learning system for personalized product recommendations and no
 import pandas as pd
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity, euclidean_distances
-from sklearn.cluster import KMeans
-from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics.pairwise import euclidean_distances
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.ensemble import HistGradientBoostingClassifier
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler, LabelEncoder
+from sklearn.preprocessing import StandardScaler, LabelEncoder, normalize
+from scipy.sparse import csr_matrix
 import joblib
 from datetime import datetime, timedelta
 import logging
-from typing import List, Dict, Tuple, Optional
-import psycopg2
+import heapq
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Optional, NamedTuple
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
+import threading
+import atexit
+import copy
 
 logger = logging.getLogger(__name__)
 
+# Rows pulled per round-trip when streaming training data through server-side cursors
+LOAD_FETCH_SIZE = 50000
+
+# Engagement score change per interaction type
+ENGAGEMENT_BOOSTS = {
+    'opened': 0.05,
+    'clicked': 0.10,
+    'converted': 0.20,
+    'unsubscribed': -0.30
+}
+
+# Engagement updates are written in batches of this size, or after this many seconds
+ENGAGEMENT_FLUSH_SIZE = 500
+ENGAGEMENT_FLUSH_INTERVAL = 2.0
+
+# Nearest-neighbour lists kept for recently recommended users (LRU, one per collaborative model)
+SIMILAR_USERS_CACHE_SIZE = 10000
+
+# Engine state that belongs to the serving instance and is never swapped by a background retrain
+SERVING_STATE_ATTRIBUTES = (
+    'db_config', '_pool', '_pool_lock', '_engagement_buffer', '_engagement_lock',
+    '_flush_timer', '_similar_users_lock', '_retrain_lock'
+)
+
+# Users per mini-batch when fitting or incrementally updating the user clusters
+CLUSTERING_BATCH_SIZE = 2048
+
+# Users scored per sparse similarity matmul in batch recommendations (bounds the dense block size)
+SIMILARITY_BLOCK_SIZE = 256
+
+class RecommendationModels(NamedTuple):
+    """One generation of recommendation state, replaced as a whole so each call reads a consistent set"""
+    user_item_matrix: Optional[csr_matrix] = None
+    user_item_norm: Optional[csr_matrix] = None
+    user_row_index: Dict = {}
+    product_ids: Optional[np.ndarray] = None
+    similar_users_cache: Optional[OrderedDict] = None
+    product_tfidf: Optional[csr_matrix] = None
+    catalog_product_ids: Optional[np.ndarray] = None
+    product_row_index: Dict = {}
+
+def top_k_indices(scores: np.ndarray, k: int, exclude: Optional[int] = None) -> np.ndarray:
+    """Indices of the k highest scores in descending order, via an O(N) partial sort"""
+    if exclude is not None:
+        scores = scores.copy()
+        scores[exclude] = -np.inf
+        k = min(k, len(scores) - 1)
+    else:
+        k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
 class MLRecommendationEngine:
     """
     Advanced ML-based recommendation engine for GETTO personalized notifications
@@ -28,92 +92,158 @@ class MLRecommendationEngine:
     
     def __init__(self, db_config: Dict):
         self.db_config = db_config
-        self.user_item_matrix = None
+        # Collaborative and content-based state; builders publish a new tuple rather than
+        # mutating it, and readers load it once per call
+        self.models = RecommendationModels()
+        self._similar_users_lock = threading.Lock()
         self.product_features = None
+        self._product_meta = {}
         self.user_clusters = None
+        self.kmeans = None
         self.engagement_model = None
         self.timing_model = None
         self.scaler = StandardScaler()
         
+        # Connections are pooled and created lazily on first use
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        
+        # Pending (user_id, interaction_type) events for users.engagement_score
+        self._engagement_buffer: List[Tuple[str, str]] = []
+        self._engagement_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+        atexit.register(self.flush_engagement_updates)
+        
+        # Held while a background retrain runs so only one runs at a time
+        self._retrain_lock = threading.Lock()
+        
         # Initialize models
         self.initialize_models()
     
+    def get_connection_pool(self) -> ThreadedConnectionPool:
+        """Get (or lazily create) this engine's connection pool"""
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadedConnectionPool(minconn=2, maxconn=16, **self.db_config)
+            return self._pool
+    
+    @contextmanager
     def get_db_connection(self):
-        """Create database connection"""
-        return psycopg2.connect(**self.db_config)
+        """Borrow a pooled database connection and always hand it back"""
+        pool = self.get_connection_pool()
+        conn = pool.getconn()
+        try:
+            yield conn
+        finally:
+            # putconn rolls back any transaction left open by the caller
+            pool.putconn(conn)
     
     def initialize_models(self):
         """Initialize and train ML models"""
         try:
             self.load_data()
-            self.build_collaborative_filtering_model()
-            self.build_content_based_model()
-            self.build_user_clustering_model()
-            self.build_engagement_prediction_model()
-            self.build_timing_optimization_model()
+            self.build_models()
             logger.info("All ML models initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing ML models: {e}")
     
+    def build_models(self):
+        """Build all models concurrently from the loaded data"""
+        # The builders only read their own DataFrame and each catches its own errors;
+        # numpy, scipy and sklearn release the GIL in their heavy kernels
+        builders = [
+            self.build_collaborative_filtering_model,
+            self.build_content_based_model,
+            self.build_user_clustering_model,
+            self.build_engagement_prediction_model,
+            self.build_timing_optimization_model
+        ]
+        with ThreadPoolExecutor(max_workers=len(builders)) as executor:
+            for future in [executor.submit(builder) for builder in builders]:
+                future.result()
+    
     def load_data(self):
         """Load data from database for training"""
         try:
-            conn = self.get_db_connection()
-            
-            # Load user-item interactions
-            user_items_df = pd.read_sql("""
-                SELECT u.user_id, p.product_id, p.name, p.category, p.price,
-                       COUNT(pur.id) as purchase_count,
-                       AVG(pur.price) as avg_price,
-                       MAX(pur.purchase_date) as last_purchase
-                FROM users u
-                LEFT JOIN purchases pur ON u.user_id = pur.user_id
-                LEFT JOIN products p ON pur.product_id = p.product_id
-                WHERE p.product_id IS NOT NULL
-                GROUP BY u.user_id, p.product_id, p.name, p.category, p.price
-            """, conn)
-            
-            # Load user features
-            user_features_df = pd.read_sql("""
-                SELECT u.user_id, u.total_purchases, u.total_spent, u.avg_order_value,
-                       u.engagement_score, u.segment, u.preferred_categories,
-                       EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - u.last_activity))/86400 as days_inactive,
-                       EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - u.created_at))/86400 as account_age
-                FROM users u
-            """, conn)
-            
-            # Load product features
-            products_df = pd.read_sql("""
-                SELECT product_id, name, category, subcategory, price, tags
-                FROM products WHERE is_active = true
-            """, conn)
-            
-            # Load notification history for training
-            notifications_df = pd.read_sql("""
-                SELECT nh.user_id, nh.notification_type, nh.sent_at, nh.opened_at, 
-                       nh.clicked_at, nh.converted_at, nh.personalization_score,
-                       CASE WHEN nh.opened_at IS NOT NULL THEN 1 ELSE 0 END as opened,
-                       CASE WHEN nh.clicked_at IS NOT NULL THEN 1 ELSE 0 END as clicked,
-                       CASE WHEN nh.converted_at IS NOT NULL THEN 1 ELSE 0 END as converted,
-                       EXTRACT(HOUR FROM nh.sent_at) as sent_hour,
-                       EXTRACT(DOW FROM nh.sent_at) as sent_day_of_week
-                FROM notification_history nh
-                WHERE nh.sent_at > CURRENT_TIMESTAMP - INTERVAL '30 days'
-            """, conn)
-            
-            conn.close()
+            # The four loads are independent, so run them concurrently on their own
+            # connections; wall time becomes the slowest query instead of the sum
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                # Load raw user-item purchases; counts are summed while building the sparse matrix
+                user_items_future = executor.submit(self._read_frame, 'load_user_items', """
+                    SELECT user_id, product_id
+                    FROM purchases
+                    WHERE purchase_date > CURRENT_TIMESTAMP - INTERVAL '365 days'
+                      AND user_id IS NOT NULL AND product_id IS NOT NULL
+                """)
+                
+                # Load user features
+                user_features_future = executor.submit(self._read_frame, 'load_user_features', """
+                    SELECT u.user_id, u.total_purchases, u.total_spent, u.avg_order_value,
+                           u.engagement_score, u.segment, u.preferred_categories,
+                           EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - u.last_activity))/86400 as days_inactive,
+                           EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - u.created_at))/86400 as account_age
+                    FROM users u
+                """)
+                
+                # Load product features
+                products_future = executor.submit(self._read_frame, 'load_products', """
+                    SELECT product_id, name, category, subcategory, price, tags
+                    FROM products WHERE is_active = true
+                """)
+                
+                # Load notification history for training
+                notifications_future = executor.submit(self._read_frame, 'load_notifications', """
+                    SELECT nh.user_id, nh.notification_type, nh.sent_at, nh.opened_at, 
+                           nh.clicked_at, nh.converted_at, nh.personalization_score,
+                           CASE WHEN nh.opened_at IS NOT NULL THEN 1 ELSE 0 END as opened,
+                           CASE WHEN nh.clicked_at IS NOT NULL THEN 1 ELSE 0 END as clicked,
+                           CASE WHEN nh.converted_at IS NOT NULL THEN 1 ELSE 0 END as converted,
+                           EXTRACT(HOUR FROM nh.sent_at) as sent_hour,
+                           EXTRACT(DOW FROM nh.sent_at) as sent_day_of_week
+                    FROM notification_history nh
+                    WHERE nh.sent_at > CURRENT_TIMESTAMP - INTERVAL '30 days'
+                """)
+            
+            user_items_df = user_items_future.result()
+            user_features_df = user_features_future.result()
+            products_df = products_future.result()
+            notifications_df = notifications_future.result()
             
             self.user_items_df = user_items_df
             self.user_features_df = user_features_df
             self.products_df = products_df
             self.notifications_df = notifications_df
             
-            logger.info(f"Loaded data: {len(user_items_df)} interactions, {len(user_features_df)} users, {len(products_df)} products")
+            # product_id -> (name, category, price) so recommendation details skip DataFrame scans
+            self._product_meta = dict(zip(
+                products_df['product_id'],
+                zip(products_df['name'], products_df['category'], products_df['price'].astype(float))
+            ))
+            
+            logger.info(f"Loaded data: {len(user_items_df)} purchases, {len(user_features_df)} users, {len(products_df)} products")
             
         except Exception as e:
             logger.error(f"Error loading data: {e}")
             raise
     
+    def _read_frame(self, cursor_name: str, query: str) -> pd.DataFrame:
+        """Stream a query through a named server-side cursor into a DataFrame"""
+        chunks = []
+        with self.get_db_connection() as conn, conn.cursor(name=cursor_name) as cursor:
+            cursor.itersize = LOAD_FETCH_SIZE
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(LOAD_FETCH_SIZE)
+                # Named cursors only describe their columns after the first fetch
+                columns = [col[0] for col in cursor.description]
+                if not rows:
+                    break
+                chunks.append(pd.DataFrame.from_records(rows, columns=columns, coerce_float=True))
+        
+        if not chunks:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(chunks, ignore_index=True)
+    
     def build_collaborative_filtering_model(self):
         """Build collaborative filtering recommendation model"""
         try:
@@ -121,23 +251,28 @@ class MLRecommendationEngine:
                 logger.warning("No user-item data available for collaborative filtering")
                 return
             
-            # Create user-item matrix
-            self.user_item_matrix = self.user_items_df.pivot_table(
-                index='user_id', 
-                columns='product_id', 
-                values='purchase_count', 
-                fill_value=0
+            # Create sparse user-item matrix straight from the purchase rows; duplicate
+            # (user, product) entries sum into purchase counts
+            user_codes, user_ids = pd.factorize(self.user_items_df['user_id'])
+            product_codes, product_ids = pd.factorize(self.user_items_df['product_id'])
+            user_item_matrix = csr_matrix(
+                (np.ones(len(user_codes), dtype=np.float32), (user_codes, product_codes)),
+                shape=(len(user_ids), len(product_ids)),
+                dtype=np.float32
             )
-            
-            # Calculate user similarity matrix
-            user_similarity = cosine_similarity(self.user_item_matrix)
-            self.user_similarity_df = pd.DataFrame(
-                user_similarity, 
-                index=self.user_item_matrix.index, 
-                columns=self.user_item_matrix.index
+            user_item_matrix.sum_duplicates()
+            
+            # L2-normalized rows turn cosine similarity into a plain sparse dot product;
+            # neighbour lists refer to this matrix's rows, so it gets a fresh cache
+            self.models = self.models._replace(
+                user_item_matrix=user_item_matrix,
+                user_item_norm=normalize(user_item_matrix, norm='l2'),
+                user_row_index={user_id: i for i, user_id in enumerate(user_ids)},
+                product_ids=np.asarray(product_ids),
+                similar_users_cache=OrderedDict()
             )
             
-            logger.info(f"Built collaborative filtering model with {self.user_item_matrix.shape[0]} users and {self.user_item_matrix.shape[1]} products")
+            logger.info(f"Built collaborative filtering model with {user_item_matrix.shape[0]} users and {user_item_matrix.shape[1]} products")
             
         except Exception as e:
             logger.error(f"Error building collaborative filtering model: {e}")
@@ -155,15 +290,16 @@ class MLRecommendationEngine:
                           self.products_df['subcategory'].fillna('')
             
             # TF-IDF vectorization
-            self.tfidf_vectorizer = TfidfVectorizer(max_features=1000, stop_words='english')
+            self.tfidf_vectorizer = TfidfVectorizer(max_features=1000, stop_words='english', dtype=np.float32)
             self.product_tfidf_matrix = self.tfidf_vectorizer.fit_transform(products_text)
             
-            # Calculate product similarity matrix
-            product_similarity = cosine_similarity(self.product_tfidf_matrix)
-            self.product_similarity_df = pd.DataFrame(
-                product_similarity,
-                index=self.products_df['product_id'],
-                columns=self.products_df['product_id']
+            # TfidfVectorizer rows are already L2-normalized, so cosine similarity is a sparse
+            # dot product computed per query instead of a dense P x P matrix
+            catalog_product_ids = self.products_df['product_id'].to_numpy()
+            self.models = self.models._replace(
+                product_tfidf=normalize(self.product_tfidf_matrix, norm='l2', copy=False),
+                catalog_product_ids=catalog_product_ids,
+                product_row_index={product_id: i for i, product_id in enumerate(catalog_product_ids)}
             )
             
             logger.info(f"Built content-based model with {len(self.products_df)} products")
@@ -182,12 +318,14 @@ class MLRecommendationEngine:
             clustering_features = ['total_purchases', 'total_spent', 'avg_order_value', 
                                  'engagement_score', 'days_inactive', 'account_age']
             
-            X = self.user_features_df[clustering_features].fillna(0)
+            X = self.user_features_df[clustering_features].fillna(0).to_numpy(np.float32)
             X_scaled = self.scaler.fit_transform(X)
             
-            # K-means clustering
-            self.kmeans = KMeans(n_clusters=5, random_state=42)
-            user_clusters = self.kmeans.fit_predict(X_scaled)
+            # Mini-batch k-means: each step only touches CLUSTERING_BATCH_SIZE users, and the
+            # fitted model can later absorb new users with partial_fit instead of a full refit
+            kmeans = MiniBatchKMeans(n_clusters=5, batch_size=CLUSTERING_BATCH_SIZE, n_init='auto', random_state=42)
+            user_clusters = kmeans.fit_predict(X_scaled)
+            self.kmeans = kmeans
             
             self.user_features_df['ml_cluster'] = user_clusters
             
@@ -196,6 +334,17 @@ class MLRecommendationEngine:
         except Exception as e:
             logger.error(f"Error building user clustering model: {e}")
     
+    def update_user_clustering(self, new_users_df: pd.DataFrame) -> np.ndarray:
+        """Fold new or changed users into the existing clusters and return their cluster ids"""
+        clustering_features = ['total_purchases', 'total_spent', 'avg_order_value', 
+                             'engagement_score', 'days_inactive', 'account_age']
+        
+        X_scaled = self.scaler.transform(new_users_df[clustering_features].fillna(0).to_numpy(np.float32))
+        for start in range(0, len(X_scaled), CLUSTERING_BATCH_SIZE):
+            self.kmeans.partial_fit(X_scaled[start:start + CLUSTERING_BATCH_SIZE])
+        
+        return self.kmeans.predict(X_scaled)
+    
     def build_engagement_prediction_model(self):
         """Build model to predict notification engagement"""
         try:
@@ -205,18 +354,20 @@ class MLRecommendationEngine:
             
             # Prepare features
             feature_cols = ['personalization_score', 'sent_hour', 'sent_day_of_week']
-            X = self.notifications_df[feature_cols].fillna(0)
+            X = self.notifications_df[feature_cols].fillna(0).to_numpy(np.float32)
             y = self.notifications_df['opened'].fillna(0)
             
             if len(X) < 10:
                 logger.warning("Insufficient data for engagement model training")
                 return
             
-            # Train random forest model
+            # Train histogram gradient boosting model; its binned trees predict far faster
+            # than a 100-tree random forest on the per-notification path
             X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
             
-            self.engagement_model = RandomForestClassifier(n_estimators=100, random_state=42)
-            self.engagement_model.fit(X_train, y_train)
+            engagement_model = HistGradientBoostingClassifier(max_iter=100, max_depth=6, random_state=42)
+            engagement_model.fit(X_train, y_train)
+            self.engagement_model = engagement_model
             
             # Calculate accuracy
             accuracy = self.engagement_model.score(X_test, y_test)
@@ -231,73 +382,127 @@ class MLRecommendationEngine:
             if self.notifications_df.empty:
                 return
             
-            # Group by hour to find optimal sending times
-            hourly_engagement = self.notifications_df.groupby('sent_hour').agg({
-                'opened': 'mean',
-                'clicked': 'mean',
-                'converted': 'mean'
-            }).reset_index()
-            
-            # Find best hours for each metric
-            self.optimal_hours = {
-                'opens': hourly_engagement.loc[hourly_engagement['opened'].idxmax(), 'sent_hour'],
-                'clicks': hourly_engagement.loc[hourly_engagement['clicked'].idxmax(), 'sent_hour'],
-                'conversions': hourly_engagement.loc[hourly_engagement['converted'].idxmax(), 'sent_hour']
-            }
-            
-            logger.info(f"Built timing optimization model. Best hours: {self.optimal_hours}")
+            # Bucket sends by hour and by (hour, day of week) with bincount instead of a groupby
+            hours = self.notifications_df['sent_hour'].to_numpy(np.intp)
+            days = self.notifications_df['sent_day_of_week'].to_numpy(np.intp)
+            slots = hours * 7 + days
+            hour_counts = np.bincount(hours, minlength=24)
+            slot_counts = np.bincount(slots, minlength=24 * 7)
+            
+            # Find best hour, and best (hour, day of week), for each metric;
+            # buckets without any sends can never win
+            self.optimal_hours = {}
+            self.optimal_hour_days = {}
+            for metric, column in (('opens', 'opened'), ('clicks', 'clicked'), ('conversions', 'converted')):
+                outcomes = self.notifications_df[column].to_numpy(np.float64)
+                
+                hour_rates = np.bincount(hours, weights=outcomes, minlength=24) / np.maximum(hour_counts, 1)
+                hour_rates[hour_counts == 0] = -1
+                self.optimal_hours[metric] = int(hour_rates.argmax())
+                
+                slot_rates = np.bincount(slots, weights=outcomes, minlength=24 * 7) / np.maximum(slot_counts, 1)
+                slot_rates[slot_counts == 0] = -1
+                self.optimal_hour_days[metric] = divmod(int(slot_rates.argmax()), 7)
+            
+            logger.info(f"Built timing optimization model. Best hours: {self.optimal_hours}, "
+                        f"best (hour, day of week): {self.optimal_hour_days}")
             
         except Exception as e:
             logger.error(f"Error building timing optimization model: {e}")
     
     def get_collaborative_recommendations(self, user_id: str, n_recommendations: int = 5) -> List[str]:
         """Get collaborative filtering recommendations"""
+        return self.get_collaborative_recommendations_batch([user_id], n_recommendations)[user_id]
+    
+    def get_collaborative_recommendations_batch(self, user_ids: List[str], n_recommendations: int = 5) -> Dict[str, List[str]]:
+        """Get collaborative filtering recommendations for many users with blocked sparse matmuls"""
+        results = {user_id: [] for user_id in user_ids}
         try:
-            if self.user_item_matrix is None or user_id not in self.user_item_matrix.index:
-                return []
-            
-            # Get similar users
-            user_similarities = self.user_similarity_df.loc[user_id].sort_values(ascending=False)[1:6]
-            
-            # Get products purchased by similar users
-            similar_users = user_similarities.index.tolist()
-            recommendations = []
-            
-            for similar_user in similar_users:
-                user_purchases = self.user_item_matrix.loc[similar_user]
-                # Get products this user hasn't purchased
-                current_user_purchases = self.user_item_matrix.loc[user_id]
-                new_products = user_purchases[current_user_purchases == 0]
-                recommendations.extend(new_products[new_products > 0].index.tolist())
-            
-            # Return unique recommendations
-            return list(set(recommendations))[:n_recommendations]
+            models = self.models
+            if models.user_item_matrix is None:
+                return results
+            
+            known_users = [(user_id, models.user_row_index[user_id]) for user_id in results
+                           if user_id in models.user_row_index]
+            
+            # Reuse cached neighbour lists; only users without one need a similarity row
+            similar_by_idx = {}
+            with self._similar_users_lock:
+                for _, user_idx in known_users:
+                    similar_users = models.similar_users_cache.get(user_idx)
+                    if similar_users is not None:
+                        models.similar_users_cache.move_to_end(user_idx)
+                        similar_by_idx[user_idx] = similar_users
+            missing = [user_idx for _, user_idx in known_users if user_idx not in similar_by_idx]
+            
+            for start in range(0, len(missing), SIMILARITY_BLOCK_SIZE):
+                rows = np.asarray(missing[start:start + SIMILARITY_BLOCK_SIZE], dtype=np.intp)
+                
+                # Similarities of every user in the block against all users in one sparse GEMM
+                block_sims = (models.user_item_norm[rows] @ models.user_item_norm.T).toarray()
+                
+                for user_idx, sims in zip(rows, block_sims):
+                    similar_by_idx[user_idx] = top_k_indices(sims, 5, exclude=user_idx)
+                self._cache_similar_users(models.similar_users_cache, rows, similar_by_idx)
+            
+            for user_id, user_idx in known_users:
+                results[user_id] = self._products_from_similar_users(
+                    models, user_idx, similar_by_idx[user_idx], n_recommendations
+                )
+            
+            return results
             
         except Exception as e:
             logger.error(f"Error getting collaborative recommendations: {e}")
-            return []
+            return results
+    
+    def _cache_similar_users(self, cache: OrderedDict, rows: np.ndarray, similar_by_idx: Dict[int, np.ndarray]):
+        """Remember neighbour lists for rows, evicting the least recently used"""
+        with self._similar_users_lock:
+            for user_idx in rows:
+                cache[user_idx] = similar_by_idx[user_idx]
+            while len(cache) > SIMILAR_USERS_CACHE_SIZE:
+                cache.popitem(last=False)
+    
+    def _products_from_similar_users(self, models: RecommendationModels, user_idx: int,
+                                     similar_users: np.ndarray, n_recommendations: int) -> List[str]:
+        """Products bought by similar users that the user hasn't purchased"""
+        # How many of the similar users bought each product, in one sparse row-slice reduction
+        candidates = np.asarray((models.user_item_matrix[similar_users] > 0).sum(axis=0)).ravel()
+        candidates[models.user_item_matrix[user_idx].indices] = 0
+        
+        # Most widely bought first; products no similar user bought are never recommended
+        top = top_k_indices(candidates, n_recommendations)
+        return list(models.product_ids[top[candidates[top] > 0]])
     
     def get_content_based_recommendations(self, user_id: str, n_recommendations: int = 5) -> List[str]:
         """Get content-based recommendations"""
         try:
-            if self.product_similarity_df is None:
+            models = self.models
+            if models.product_tfidf is None:
                 return []
             
-            # Get user's purchase history
-            user_purchases = self.user_items_df[self.user_items_df['user_id'] == user_id]['product_id'].tolist()
+            # Get user's purchase history from their row of the user-item matrix
+            user_idx = models.user_row_index.get(user_id)
+            if user_idx is None:
+                return []
+            user_purchases = models.product_ids[models.user_item_matrix[user_idx].indices]
             
-            if not user_purchases:
+            # Find similar products, scoring all purchased products against the catalog at once
+            rows = [models.product_row_index[p] for p in user_purchases if p in models.product_row_index]
+            if not rows:
                 return []
+            purchase_sims = (models.product_tfidf[rows] @ models.product_tfidf.T).toarray()
             
-            # Find similar products
-            recommendations = []
-            for product_id in user_purchases:
-                if product_id in self.product_similarity_df.index:
-                    similar_products = self.product_similarity_df.loc[product_id].sort_values(ascending=False)[1:4]
-                    recommendations.extend(similar_products.index.tolist())
+            # Ordered dedup keeps each product at its best rank; stop once we have enough
+            recommendations = {}
+            for row, sims in zip(rows, purchase_sims):
+                similar_products = top_k_indices(sims, 3, exclude=row)
+                recommendations.update(dict.fromkeys(models.catalog_product_ids[similar_products]))
+                if len(recommendations) >= n_recommendations:
+                    break
             
-            # Return unique recommendations
-            return list(set(recommendations))[:n_recommendations]
+            return list(recommendations)[:n_recommendations]
             
         except Exception as e:
             logger.error(f"Error getting content-based recommendations: {e}")
@@ -305,44 +510,57 @@ class MLRecommendationEngine:
     
     def get_hybrid_recommendations(self, user_id: str, n_recommendations: int = 5) -> List[Dict]:
         """Get hybrid recommendations combining collaborative and content-based"""
+        return self.get_hybrid_recommendations_batch([user_id], n_recommendations)[user_id]
+    
+    def get_hybrid_recommendations_batch(self, user_ids: List[str], n_recommendations: int = 5) -> Dict[str, List[Dict]]:
+        """Get hybrid recommendations for many users, e.g. for a bulk notification send"""
+        results = {user_id: [] for user_id in user_ids}
         try:
-            # Get recommendations from both approaches
-            collab_recs = self.get_collaborative_recommendations(user_id, n_recommendations)
-            content_recs = self.get_content_based_recommendations(user_id, n_recommendations)
-            
-            # Combine and weight recommendations
-            all_recs = {}
-            
-            # Weight collaborative filtering recommendations higher
-            for i, product_id in enumerate(collab_recs):
-                score = (len(collab_recs) - i) / len(collab_recs) * 0.7
-                all_recs[product_id] = all_recs.get(product_id, 0) + score
-            
-            # Weight content-based recommendations
-            for i, product_id in enumerate(content_recs):
-                score = (len(content_recs) - i) / len(content_recs) * 0.3
-                all_recs[product_id] = all_recs.get(product_id, 0) + score
-            
-            # Sort by score and get product details
-            sorted_recs = sorted(all_recs.items(), key=lambda x: x[1], reverse=True)
-            
-            recommendations = []
-            for product_id, score in sorted_recs[:n_recommendations]:
-                product_info = self.products_df[self.products_df['product_id'] == product_id]
-                if not product_info.empty:
-                    recommendations.append({
-                        'product_id': product_id,
-                        'name': product_info.iloc[0]['name'],
-                        'category': product_info.iloc[0]['category'],
-                        'price': float(product_info.iloc[0]['price']),
-                        'recommendation_score': score
-                    })
-            
-            return recommendations
+            # Collaborative recommendations for the whole batch share blocked matmuls
+            collab_batch = self.get_collaborative_recommendations_batch(user_ids, n_recommendations)
+            
+            for user_id in results:
+                content_recs = self.get_content_based_recommendations(user_id, n_recommendations)
+                results[user_id] = self._merge_hybrid_recommendations(
+                    collab_batch[user_id], content_recs, n_recommendations
+                )
+            
+            return results
             
         except Exception as e:
             logger.error(f"Error getting hybrid recommendations: {e}")
-            return []
+            return results
+    
+    def _merge_hybrid_recommendations(self, collab_recs: List[str], content_recs: List[str],
+                                      n_recommendations: int) -> List[Dict]:
+        """Weight and merge both ranked lists, then attach product details"""
+        # Combine and weight recommendations; collaborative filtering is weighted higher.
+        # Each list scores by rank: weight * (len - i) / len
+        all_recs = {}
+        for recs, weight in ((collab_recs, 0.7), (content_recs, 0.3)):
+            if not recs:
+                continue
+            step = weight / len(recs)
+            for i, product_id in enumerate(recs):
+                all_recs[product_id] = all_recs.get(product_id, 0) + (len(recs) - i) * step
+        
+        # Take the top-scoring products and get product details
+        top_recs = heapq.nlargest(n_recommendations, all_recs.items(), key=itemgetter(1))
+        
+        recommendations = []
+        for product_id, score in top_recs:
+            meta = self._product_meta.get(product_id)
+            if meta is not None:
+                name, category, price = meta
+                recommendations.append({
+                    'product_id': product_id,
+                    'name': name,
+                    'category': category,
+                    'price': price,
+                    'recommendation_score': score
+                })
+        
+        return recommendations
     
     def predict_engagement(self, personalization_score: float, hour: int, day_of_week: int) -> float:
         """Predict notification engagement probability"""
@@ -350,7 +568,7 @@ class MLRecommendationEngine:
             if self.engagement_model is None:
                 return 0.5  # Default probability
             
-            features = np.array([[personalization_score, hour, day_of_week]])
+            features = np.array([[personalization_score, hour, day_of_week]], dtype=np.float32)
             probability = self.engagement_model.predict_proba(features)[0][1]
             return probability
             
@@ -358,6 +576,19 @@ class MLRecommendationEngine:
             logger.error(f"Error predicting engagement: {e}")
             return 0.5
     
+    def predict_engagement_batch(self, features: np.ndarray) -> np.ndarray:
+        """Predict engagement probabilities for rows of (personalization_score, hour, day_of_week)"""
+        features = np.asarray(features, dtype=np.float32)
+        try:
+            if self.engagement_model is None:
+                return np.full(len(features), 0.5)
+            
+            return self.engagement_model.predict_proba(features)[:, 1]
+            
+        except Exception as e:
+            logger.error(f"Error predicting engagement batch: {e}")
+            return np.full(len(features), 0.5)
+    
     def get_optimal_send_time(self, user_id: str, metric: str = 'opens') -> int:
         """Get optimal hour to send notification for maximum engagement"""
         try:
@@ -373,66 +604,123 @@ class MLRecommendationEngine:
             return 10
     
     def update_user_engagement_score(self, user_id: str, interaction_type: str):
-        """Update user engagement score based on interaction"""
+        """Queue an engagement score update; written by flush_engagement_updates"""
+        with self._engagement_lock:
+            self._engagement_buffer.append((user_id, interaction_type))
+            flush_now = len(self._engagement_buffer) >= ENGAGEMENT_FLUSH_SIZE
+            if not flush_now and self._flush_timer is None:
+                self._flush_timer = threading.Timer(ENGAGEMENT_FLUSH_INTERVAL, self.flush_engagement_updates)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        
+        if flush_now:
+            self.flush_engagement_updates()
+    
+    def flush_engagement_updates(self):
+        """Write all buffered engagement updates in a single batch"""
+        with self._engagement_lock:
+            events, self._engagement_buffer = self._engagement_buffer, []
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        
+        if events:
+            self.update_user_engagement_scores(events)
+    
+    def update_user_engagement_scores(self, events: List[Tuple[str, str]]):
+        """Apply many (user_id, interaction_type) events with one UPDATE"""
         try:
-            conn = self.get_db_connection()
-            cursor = conn.cursor()
-            
-            # Calculate engagement boost based on interaction type
-            engagement_boost = {
-                'opened': 0.05,
-                'clicked': 0.10,
-                'converted': 0.20,
-                'unsubscribed': -0.30
-            }
-            
-            boost = engagement_boost.get(interaction_type, 0)
-            
-            cursor.execute("""
-                UPDATE users 
-                SET engagement_score = LEAST(1.0, GREATEST(0.0, engagement_score + %s))
-                WHERE user_id = %s
-            """, (boost, user_id))
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
-            
-            logger.info(f"Updated engagement score for user {user_id} with {interaction_type}")
+            # UPDATE ... FROM touches each user once, so sum the boosts per user first
+            boosts: Dict[str, float] = {}
+            for user_id, interaction_type in events:
+                boosts[user_id] = boosts.get(user_id, 0) + ENGAGEMENT_BOOSTS.get(interaction_type, 0)
+            
+            with self.get_db_connection() as conn, conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE users 
+                    SET engagement_score = LEAST(1.0, GREATEST(0.0, users.engagement_score + v.boost))
+                    FROM (SELECT unnest(%s::text[]) AS user_id, unnest(%s::float8[]) AS boost) v
+                    WHERE users.user_id = v.user_id
+                """, (list(boosts.keys()), list(boosts.values())))
+                
+                conn.commit()
+            
+            logger.info(f"Updated engagement scores for {len(boosts)} users from {len(events)} interactions")
             
         except Exception as e:
-            logger.error(f"Error updating engagement score: {e}")
+            logger.error(f"Error updating engagement scores: {e}")
     
     def retrain_models(self):
         """Retrain all ML models with latest data"""
         try:
             logger.info("Starting model retraining...")
             self.load_data()
-            self.build_collaborative_filtering_model()
-            self.build_content_based_model()
-            self.build_user_clustering_model()
-            self.build_engagement_prediction_model()
-            self.build_timing_optimization_model()
+            self.build_models()
             logger.info("Model retraining completed successfully")
             
         except Exception as e:
             logger.error(f"Error retraining models: {e}")
     
+    def retrain_models_in_background(self) -> Optional[threading.Thread]:
+        """Retrain on a daemon thread and swap the new models in once they are ready"""
+        if not self._retrain_lock.acquire(blocking=False):
+            logger.info("Model retraining already in progress")
+            return None
+        
+        thread = threading.Thread(target=self._retrain_and_swap, daemon=True)
+        thread.start()
+        return thread
+    
+    def _retrain_and_swap(self):
+        """Build models on a shadow copy of the engine, then publish them in one step"""
+        try:
+            logger.info("Starting background model retraining...")
+            
+            # The shadow shares the pool but gets its own mutable model state, so the
+            # serving instance keeps answering from the old models until the swap;
+            # recommendation state moves over as the single self.models reference
+            self.get_connection_pool()
+            shadow = copy.copy(self)
+            shadow.scaler = StandardScaler()
+            shadow.load_data()
+            shadow.build_models()
+            
+            new_state = {name: value for name, value in shadow.__dict__.items()
+                         if name not in SERVING_STATE_ATTRIBUTES}
+            self.__dict__.update(new_state)
+            logger.info("Background model retraining completed; new models are live")
+            
+        except Exception as e:
+            logger.error(f"Error retraining models in background: {e}")
+        finally:
+            self._retrain_lock.release()
+    
     def save_models(self, model_path: str = "ml_models/"):
         """Save trained models to disk"""
         try:
             import os
             os.makedirs(model_path, exist_ok=True)
             
-            # Save models that can be serialized
+            # Save models that can be serialized, uncompressed so load_models can memory-map them
             if self.engagement_model is not None:
-                joblib.dump(self.engagement_model, f"{model_path}/engagement_model.pkl")
+                joblib.dump(self.engagement_model, f"{model_path}/engagement_model.pkl", compress=0)
             
             if self.kmeans is not None:
-                joblib.dump(self.kmeans, f"{model_path}/user_clustering_model.pkl")
+                joblib.dump(self.kmeans, f"{model_path}/user_clustering_model.pkl", compress=0)
             
             if self.scaler is not None:
-                joblib.dump(self.scaler, f"{model_path}/scaler.pkl")
+                joblib.dump(self.scaler, f"{model_path}/scaler.pkl", compress=0)
+            
+            # joblib can't memory-map sparse matrices, so store the TF-IDF CSR arrays as .npy files
+            models = self.models
+            if models.product_tfidf is not None:
+                np.save(f"{model_path}/product_tfidf_data.npy", models.product_tfidf.data)
+                np.save(f"{model_path}/product_tfidf_indices.npy", models.product_tfidf.indices)
+                np.save(f"{model_path}/product_tfidf_indptr.npy", models.product_tfidf.indptr)
+                joblib.dump({
+                    'shape': models.product_tfidf.shape,
+                    'product_ids': models.catalog_product_ids
+                }, f"{model_path}/product_tfidf_meta.pkl")
             
             logger.info(f"Models saved to {model_path}")
             
@@ -444,14 +732,29 @@ class MLRecommendationEngine:
         try:
             import os
             
+            # Memory-map model arrays so warm starts skip the copy and share pages across workers
             if os.path.exists(f"{model_path}/engagement_model.pkl"):
-                self.engagement_model = joblib.load(f"{model_path}/engagement_model.pkl")
+                self.engagement_model = joblib.load(f"{model_path}/engagement_model.pkl", mmap_mode='r')
             
             if os.path.exists(f"{model_path}/user_clustering_model.pkl"):
+                # Not memory-mapped: partial_fit updates the (tiny) centroid arrays in place
                 self.kmeans = joblib.load(f"{model_path}/user_clustering_model.pkl")
             
             if os.path.exists(f"{model_path}/scaler.pkl"):
-                self.scaler = joblib.load(f"{model_path}/scaler.pkl")
+                self.scaler = joblib.load(f"{model_path}/scaler.pkl", mmap_mode='r')
+            
+            if os.path.exists(f"{model_path}/product_tfidf_meta.pkl"):
+                meta = joblib.load(f"{model_path}/product_tfidf_meta.pkl")
+                product_tfidf = csr_matrix((
+                    np.load(f"{model_path}/product_tfidf_data.npy", mmap_mode='r'),
+                    np.load(f"{model_path}/product_tfidf_indices.npy", mmap_mode='r'),
+                    np.load(f"{model_path}/product_tfidf_indptr.npy", mmap_mode='r')
+                ), shape=meta['shape'], copy=False)
+                self.models = self.models._replace(
+                    product_tfidf=product_tfidf,
+                    catalog_product_ids=meta['product_ids'],
+                    product_row_index={product_id: i for i, product_id in enumerate(meta['product_ids'])}
+                )
             
             logger.info(f"Models loaded from {model_path}")
             
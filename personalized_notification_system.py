@@ -4,28 +4,37 @@ GETTO Personalized Notification System
 Advanced FCM push notification system with user segmentation and ML-based personalization
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
 import firebase_admin
 from firebase_admin import credentials, messaging
 import os
+import sys
 from dotenv import load_dotenv
+from server_common import (FCM_MULTICAST_LIMIT, ORJSONProvider, execute_prepared, preparing_connection,
+                           widen_fcm_connection_pool)
 import json
+import orjson
+import csv
+import hashlib
+import io
 from datetime import datetime, timedelta
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, Json, execute_values, register_default_json, register_default_jsonb
+from psycopg2.pool import ThreadedConnectionPool
 import logging
-import pandas as pd
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.cluster import KMeans
-import schedule
+from sklearn.metrics.pairwise import linear_kernel
+import joblib
 import time
 import threading
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from string import Formatter
 from typing import List, Dict, Optional
 from enum import Enum
+from types import MappingProxyType
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -33,7 +42,12 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Decode json/jsonb columns (preferences, categories, cart and wishlist rows, metadata) with orjson
+register_default_json(loads=orjson.loads, globally=True)
+register_default_jsonb(loads=orjson.loads, globally=True)
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 CORS(app)
 
 # Database configuration
@@ -45,6 +59,104 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD', 'password')
 }
 
+# Connections kept open by the engine's pool; size the max to the number of serving threads
+DB_POOL_MIN_SIZE = 2
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 20))
+
+# Fitted product TF-IDF index, reused across restarts while the catalog is unchanged
+PRODUCT_INDEX_PATH = os.getenv('PRODUCT_INDEX_PATH', 'ml_models/product_tfidf_index.pkl')
+
+# Users scored per sparse similarity multiply in bulk recommendations (bounds the dense block size)
+SIMILARITY_CHUNK_SIZE = 1024
+
+# Personalized sends run on this many background threads so request threads never wait on FCM
+NOTIFICATION_SEND_WORKERS = 16
+
+# Rows returned by score_users_bulk
+SCORED_USER_DTYPE = np.dtype([('user_id', object), ('segment', object), ('personalization_score', np.float64)])
+
+# Seconds between refreshes of the user_segment_cache materialized view
+USER_SEGMENT_REFRESH_INTERVAL = 300
+
+# Advisory lock taken per refresh, so only one of several server processes runs it
+USER_SEGMENT_REFRESH_LOCK_ID = 7301
+
+# Built user profiles are reused for this many seconds (bounded by size)
+USER_PROFILE_CACHE_TTL = 300
+USER_PROFILE_CACHE_SIZE = 100000
+
+# Hot queries are prepared once per pooled connection, then run with EXECUTE so
+# Postgres skips parsing and planning on every request
+PREPARED_STATEMENTS = {
+    'upsert_user': """
+        PREPARE upsert_user (varchar, varchar, varchar) AS
+        INSERT INTO users (user_id, email, phone, last_activity)
+        VALUES ($1, $2, $3, CURRENT_TIMESTAMP)
+        ON CONFLICT (user_id) 
+        DO UPDATE SET 
+            email = EXCLUDED.email,
+            phone = EXCLUDED.phone,
+            last_activity = CURRENT_TIMESTAMP
+    """,
+    'upsert_device': """
+        PREPARE upsert_device (varchar, varchar, text, varchar) AS
+        INSERT INTO fcm_devices (user_id, device_id, fcm_token, platform, last_active)
+        VALUES ($1, $2, $3, $4, CURRENT_TIMESTAMP)
+        ON CONFLICT (device_id)
+        DO UPDATE SET 
+            fcm_token = EXCLUDED.fcm_token,
+            last_active = CURRENT_TIMESTAMP,
+            is_active = true
+    """,
+    'user_profile': """
+        PREPARE user_profile (varchar) AS
+        WITH purchase_stats AS (
+            SELECT COUNT(*) as total_purchases,
+                   COALESCE(AVG(price), 0) as avg_order_value
+            FROM purchases
+            WHERE user_id = $1
+        ), cart AS (
+            SELECT COALESCE(json_agg(row_to_json(c)), '[]'::json) as cart_items
+            FROM (
+                SELECT ci.*, p.name, p.price, p.category
+                FROM cart_items ci
+                JOIN products p ON ci.product_id = p.product_id
+                WHERE ci.user_id = $1
+            ) c
+        ), wishlist AS (
+            SELECT COALESCE(json_agg(row_to_json(w)), '[]'::json) as wishlist_items
+            FROM (
+                SELECT wi.*, p.name, p.price, p.category
+                FROM wishlist_items wi
+                JOIN products p ON wi.product_id = p.product_id
+                WHERE wi.user_id = $1
+            ) w
+        ), categories AS (
+            SELECT COALESCE(array_agg(category ORDER BY frequency DESC), '{}') as preferred_categories
+            FROM (
+                SELECT p.category, COUNT(*) as frequency
+                FROM purchases pur
+                JOIN products p ON pur.product_id = p.product_id
+                WHERE pur.user_id = $1
+                GROUP BY p.category
+                ORDER BY frequency DESC
+                LIMIT 3
+            ) top_categories
+        )
+        SELECT u.created_at, u.last_activity, u.notification_preferences, u.engagement_score,
+               purchase_stats.total_purchases, purchase_stats.avg_order_value,
+               cart.cart_items, wishlist.wishlist_items, categories.preferred_categories,
+               sc.segment as cached_segment
+        FROM users u
+        LEFT JOIN user_segment_cache sc ON sc.user_id = u.user_id,
+        purchase_stats, cart, wishlist, categories
+        WHERE u.user_id = $1
+    """
+}
+
+# Pooled connections prepare these statements on first use
+PreparingConnection = preparing_connection(PREPARED_STATEMENTS)
+
 class UserSegment(Enum):
     NEW_USER = "new_user"
     ACTIVE_USER = "active_user" 
@@ -64,7 +176,28 @@ class NotificationType(Enum):
     LOYALTY_REWARD = "loyalty_reward"
     RE_ENGAGEMENT = "re_engagement"
 
-@dataclass
+# Per-instance __dict__ is dropped where dataclasses support slots (Python 3.10+)
+DATACLASS_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+def compile_format(text: str) -> tuple:
+    """Split a str.format template into (literal, field_name, format_spec) parts"""
+    return tuple((literal, field_name, spec) for literal, field_name, spec, _ in Formatter().parse(text))
+
+def render_format(parts: tuple, values: Dict) -> str:
+    """Fill a compile_format template from values without re-parsing it"""
+    return ''.join(
+        literal if field_name is None else literal + format(values[field_name], spec)
+        for literal, field_name, spec in parts
+    )
+
+def catalog_digest(product_ids: List[str], product_texts: List[str]) -> str:
+    """Hash of the catalog a TF-IDF index is fitted on, so edited product texts force a refit"""
+    digest = hashlib.blake2b(digest_size=16)
+    for product_id, text in zip(product_ids, product_texts):
+        digest.update(f"{product_id}\0{text}\x1e".encode())
+    return digest.hexdigest()
+
+@dataclass(**DATACLASS_SLOTS)
 class UserProfile:
     user_id: str
     segment: UserSegment
@@ -77,21 +210,90 @@ class UserProfile:
     notification_preferences: Dict
     engagement_score: float
 
-@dataclass
+@dataclass(frozen=True, **DATACLASS_SLOTS)
 class NotificationTemplate:
     type: NotificationType
     title: str
     body: str
     priority: str
     personalization_data: Dict
+    # title and body split into format parts once, so sends never re-parse them
+    compiled_title: tuple = field(init=False, repr=False, compare=False)
+    compiled_body: tuple = field(init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        # Frozen instances can only set their own fields through object.__setattr__
+        object.__setattr__(self, 'compiled_title', compile_format(self.title))
+        object.__setattr__(self, 'compiled_body', compile_format(self.body))
+
+# Notification templates never change at runtime, so they are built once as read-only data
+NOTIFICATION_TEMPLATES = MappingProxyType({
+    NotificationType.WELCOME: (
+        NotificationTemplate(
+            NotificationType.WELCOME,
+            "Welcome to GETTO! 🎉",
+            "Discover your perfect style with exclusive offers just for you!",
+            "high",
+            MappingProxyType({"discount": 15, "category": "all"})
+        ),
+    ),
+    NotificationType.CART_ABANDONMENT: (
+        NotificationTemplate(
+            NotificationType.CART_ABANDONMENT,
+            "Complete your GETTO journey! 🛍️",
+            "Your {item_count} item(s) are waiting - finish your order now!",
+            "medium",
+            MappingProxyType({"urgency": "medium", "discount": 10})
+        ),
+    ),
+    NotificationType.WISHLIST_REMINDER: (
+        NotificationTemplate(
+            NotificationType.WISHLIST_REMINDER,
+            "Your favorites are calling! ❤️",
+            "{product_name} from your wishlist is back in stock!",
+            "medium",
+            MappingProxyType({"stock_alert": True})
+        ),
+    ),
+    NotificationType.REORDER_SUGGESTION: (
+        NotificationTemplate(
+            NotificationType.REORDER_SUGGESTION,
+            "Time for your GETTO essentials? 🔄",
+            "Based on your history, you might need {product_name} again!",
+            "low",
+            MappingProxyType({"reorder_discount": 5})
+        ),
+    ),
+    NotificationType.NEW_PRODUCT_ALERT: (
+        NotificationTemplate(
+            NotificationType.NEW_PRODUCT_ALERT,
+            "New {category} collection just dropped! ✨",
+            "Discover the latest {category} styles perfectly matched to your taste!",
+            "medium",
+            MappingProxyType({"early_access": True})
+        ),
+    )
+})
 
 class PersonalizedNotificationEngine:
     def __init__(self, db_config):
         self.db_config = db_config
+        self.db_pool = None
+        self._db_pool_lock = threading.Lock()
         self.firebase_initialized = self.initialize_firebase()
         self.database_initialized = self.initialize_database()
+        # user_id -> (expires_at, UserProfile)
         self.user_profiles = {}
-        self.notification_templates = self.load_notification_templates()
+        self._user_profiles_lock = threading.Lock()
+        self.notification_templates = NOTIFICATION_TEMPLATES
+        
+        # Product TF-IDF index: fitted once, then only ever used to transform
+        self.tfidf = None
+        self.product_ids = []
+        self.product_matrix = None
+        if self.database_initialized:
+            self.load_product_index()
+            threading.Thread(target=self.refresh_user_segments_forever, daemon=True).start()
         
     def initialize_firebase(self):
         """Initialize Firebase Admin SDK"""
@@ -103,20 +305,41 @@ class PersonalizedNotificationEngine:
             
             cred = credentials.Certificate(service_account_path)
             firebase_admin.initialize_app(cred)
+            widen_fcm_connection_pool()
             logger.info("Firebase initialized successfully")
             return True
         except Exception as e:
             logger.error(f"Firebase initialization failed: {e}")
             return False
     
+    def get_db_pool(self):
+        """Get (or lazily create) the database connection pool"""
+        with self._db_pool_lock:
+            if self.db_pool is None:
+                self.db_pool = ThreadedConnectionPool(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE,
+                                                      connection_factory=PreparingConnection,
+                                                      **self.db_config)
+            return self.db_pool
+    
     def get_db_connection(self):
-        """Create database connection"""
+        """Borrow a database connection from the pool"""
         try:
-            return psycopg2.connect(**self.db_config)
+            return self.get_db_pool().getconn()
         except psycopg2.Error as e:
             logger.error(f"Database connection failed: {e}")
             return None
     
+    def release_db_connection(self, conn):
+        """Roll back any uncommitted work and return the connection to the pool"""
+        broken = bool(conn.closed)
+        if not broken:
+            try:
+                conn.rollback()
+            except psycopg2.Error as e:
+                logger.error(f"Discarding broken database connection: {e}")
+                broken = True
+        self.db_pool.putconn(conn, close=broken)
+    
     def initialize_database(self):
         """Initialize enhanced database schema for personalization"""
         try:
@@ -124,126 +347,215 @@ class PersonalizedNotificationEngine:
             if not conn:
                 return False
             
-            cursor = conn.cursor()
-            
-            # Enhanced users table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id VARCHAR(255) PRIMARY KEY,
-                    email VARCHAR(255),
-                    phone VARCHAR(20),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    total_purchases INTEGER DEFAULT 0,
-                    total_spent DECIMAL(10,2) DEFAULT 0.00,
-                    avg_order_value DECIMAL(10,2) DEFAULT 0.00,
-                    preferred_categories JSONB DEFAULT '[]',
-                    segment VARCHAR(50) DEFAULT 'new_user',
-                    engagement_score DECIMAL(3,2) DEFAULT 0.50,
-                    notification_preferences JSONB DEFAULT '{"enabled": true, "frequency": "normal"}',
-                    timezone VARCHAR(50) DEFAULT 'UTC'
-                )
-            """)
-            
-            # FCM devices table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS fcm_devices (
-                    id SERIAL PRIMARY KEY,
-                    user_id VARCHAR(255) REFERENCES users(user_id),
-                    device_id VARCHAR(255) UNIQUE,
-                    fcm_token TEXT NOT NULL,
-                    platform VARCHAR(20),
-                    registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT true
-                )
-            """)
-            
-            # Products table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS products (
-                    product_id VARCHAR(255) PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL,
-                    category VARCHAR(100),
-                    subcategory VARCHAR(100),
-                    price DECIMAL(10,2),
-                    description TEXT,
-                    tags JSONB DEFAULT '[]',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT true
-                )
-            """)
-            
-            # Purchase history
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS purchases (
-                    id SERIAL PRIMARY KEY,
-                    user_id VARCHAR(255) REFERENCES users(user_id),
-                    product_id VARCHAR(255) REFERENCES products(product_id),
-                    quantity INTEGER DEFAULT 1,
-                    price DECIMAL(10,2),
-                    purchase_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    order_id VARCHAR(255)
-                )
-            """)
-            
-            # Cart items
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS cart_items (
-                    id SERIAL PRIMARY KEY,
-                    user_id VARCHAR(255) REFERENCES users(user_id),
-                    product_id VARCHAR(255) REFERENCES products(product_id),
-                    quantity INTEGER DEFAULT 1,
-                    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Wishlist items
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS wishlist_items (
-                    id SERIAL PRIMARY KEY,
-                    user_id VARCHAR(255) REFERENCES users(user_id),
-                    product_id VARCHAR(255) REFERENCES products(product_id),
-                    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Notification history with analytics
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS notification_history (
-                    id SERIAL PRIMARY KEY,
-                    user_id VARCHAR(255) REFERENCES users(user_id),
-                    notification_type VARCHAR(50),
-                    title VARCHAR(255),
-                    body TEXT,
-                    sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    opened_at TIMESTAMP,
-                    clicked_at TIMESTAMP,
-                    converted_at TIMESTAMP,
-                    campaign_id VARCHAR(255),
-                    ab_test_group VARCHAR(50),
-                    personalization_score DECIMAL(3,2),
-                    metadata JSONB DEFAULT '{}'
-                )
-            """)
-            
-            # User behavior tracking
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS user_interactions (
-                    id SERIAL PRIMARY KEY,
-                    user_id VARCHAR(255) REFERENCES users(user_id),
-                    action VARCHAR(100),
-                    product_id VARCHAR(255),
-                    session_id VARCHAR(255),
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    metadata JSONB DEFAULT '{}'
-                )
-            """)
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
+            try:
+                cursor = conn.cursor()
+                
+                # Enhanced users table
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS users (
+                        user_id VARCHAR(255) PRIMARY KEY,
+                        email VARCHAR(255),
+                        phone VARCHAR(20),
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        total_purchases INTEGER DEFAULT 0,
+                        total_spent DECIMAL(10,2) DEFAULT 0.00,
+                        avg_order_value DECIMAL(10,2) DEFAULT 0.00,
+                        preferred_categories JSONB DEFAULT '[]',
+                        segment VARCHAR(50) DEFAULT 'new_user',
+                        engagement_score DECIMAL(3,2) DEFAULT 0.50,
+                        notification_preferences JSONB DEFAULT '{"enabled": true, "frequency": "normal"}',
+                        timezone VARCHAR(50) DEFAULT 'UTC'
+                    )
+                """)
+                
+                # FCM devices table
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS fcm_devices (
+                        id SERIAL PRIMARY KEY,
+                        user_id VARCHAR(255) REFERENCES users(user_id),
+                        device_id VARCHAR(255) UNIQUE,
+                        fcm_token TEXT NOT NULL,
+                        platform VARCHAR(20),
+                        registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        is_active BOOLEAN DEFAULT true
+                    )
+                """)
+                
+                # Products table
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS products (
+                        product_id VARCHAR(255) PRIMARY KEY,
+                        name VARCHAR(255) NOT NULL,
+                        category VARCHAR(100),
+                        subcategory VARCHAR(100),
+                        price DECIMAL(10,2),
+                        description TEXT,
+                        tags JSONB DEFAULT '[]',
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        is_active BOOLEAN DEFAULT true
+                    )
+                """)
+                
+                # Purchase history
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS purchases (
+                        id SERIAL PRIMARY KEY,
+                        user_id VARCHAR(255) REFERENCES users(user_id),
+                        product_id VARCHAR(255) REFERENCES products(product_id),
+                        quantity INTEGER DEFAULT 1,
+                        price DECIMAL(10,2),
+                        purchase_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        order_id VARCHAR(255)
+                    )
+                """)
+                
+                # Cart items
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS cart_items (
+                        id SERIAL PRIMARY KEY,
+                        user_id VARCHAR(255) REFERENCES users(user_id),
+                        product_id VARCHAR(255) REFERENCES products(product_id),
+                        quantity INTEGER DEFAULT 1,
+                        added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                
+                # Wishlist items
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS wishlist_items (
+                        id SERIAL PRIMARY KEY,
+                        user_id VARCHAR(255) REFERENCES users(user_id),
+                        product_id VARCHAR(255) REFERENCES products(product_id),
+                        added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                
+                # Notification history with analytics
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS notification_history (
+                        id SERIAL PRIMARY KEY,
+                        user_id VARCHAR(255) REFERENCES users(user_id),
+                        notification_type VARCHAR(50),
+                        title VARCHAR(255),
+                        body TEXT,
+                        sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        opened_at TIMESTAMP,
+                        clicked_at TIMESTAMP,
+                        converted_at TIMESTAMP,
+                        campaign_id VARCHAR(255),
+                        ab_test_group VARCHAR(50),
+                        personalization_score DECIMAL(3,2),
+                        metadata JSONB DEFAULT '{}'
+                    )
+                """)
+
+                # Time-windowed analytics aggregates (by type, by user/segment)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_nh_sent_type
+                    ON notification_history (sent_at, notification_type)
+                    INCLUDE (opened_at, clicked_at, converted_at)
+                """)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_nh_sent_user
+                    ON notification_history (sent_at, user_id)
+                """)
+
+                # Score quantized to 0-100 for compact integer aggregation in analytics
+                cursor.execute("""
+                    ALTER TABLE notification_history
+                    ADD COLUMN IF NOT EXISTS personalization_score_q SMALLINT
+                    GENERATED ALWAYS AS (ROUND(personalization_score * 100)::smallint) STORED
+                """)
+                
+                # Queued personalized sends (queued -> sent | failed), kept apart from
+                # notification_history so analytics only ever count delivered notifications
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS notification_jobs (
+                        id SERIAL PRIMARY KEY,
+                        user_id VARCHAR(255) REFERENCES users(user_id),
+                        notification_type VARCHAR(50),
+                        status VARCHAR(20) DEFAULT 'queued',
+                        queued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        finished_at TIMESTAMP,
+                        history_id INTEGER REFERENCES notification_history(id)
+                    )
+                """)
+
+                # User behavior tracking
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS user_interactions (
+                        id SERIAL PRIMARY KEY,
+                        user_id VARCHAR(255) REFERENCES users(user_id),
+                        action VARCHAR(100),
+                        product_id VARCHAR(255),
+                        session_id VARCHAR(255),
+                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        metadata JSONB DEFAULT '{}'
+                    )
+                """)
+                
+                # Per-user lookups on the profile, device and history hot paths
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_purchases_user_product
+                    ON purchases (user_id, product_id)
+                """)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_cart_items_user
+                    ON cart_items (user_id)
+                """)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_wishlist_items_user
+                    ON wishlist_items (user_id)
+                """)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_fcm_devices_user_active
+                    ON fcm_devices (user_id)
+                    WHERE is_active
+                """)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_nh_user_sent
+                    ON notification_history (user_id, sent_at DESC)
+                """)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_interactions_user_time
+                    ON user_interactions (user_id, timestamp DESC)
+                """)
+                
+                # Segments precomputed with the same rules as determine_user_segment, so profile
+                # reads don't redo them; refreshed every USER_SEGMENT_REFRESH_INTERVAL seconds
+                cursor.execute("""
+                    CREATE MATERIALIZED VIEW IF NOT EXISTS user_segment_cache AS
+                    SELECT u.user_id,
+                           CASE
+                               WHEN LOCALTIMESTAMP - u.created_at < interval '8 days' THEN 'new_user'
+                               WHEN LOCALTIMESTAMP - u.last_activity >= interval '31 days' THEN 'inactive_user'
+                               WHEN cart.cart_count > 0
+                                    AND LOCALTIMESTAMP - u.last_activity < interval '2 days' THEN 'cart_abandoner'
+                               WHEN purchase_stats.total_purchases >= 10 THEN 'vip_user'
+                               WHEN purchase_stats.total_purchases >= 3 THEN 'repeat_buyer'
+                               ELSE 'active_user'
+                           END as segment
+                    FROM users u
+                    CROSS JOIN LATERAL (
+                        SELECT COUNT(*) as cart_count FROM cart_items ci WHERE ci.user_id = u.user_id
+                    ) cart
+                    CROSS JOIN LATERAL (
+                        SELECT COUNT(*) as total_purchases FROM purchases p WHERE p.user_id = u.user_id
+                    ) purchase_stats
+                """)
+                # REFRESH ... CONCURRENTLY needs a unique index
+                cursor.execute("""
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_user_segment_cache_user
+                    ON user_segment_cache (user_id)
+                """)
+                
+                conn.commit()
+                cursor.close()
+            finally:
+                self.release_db_connection(conn)
             
             # Insert sample data
             self.insert_sample_data()
@@ -259,175 +571,357 @@ class PersonalizedNotificationEngine:
         """Insert sample data for testing"""
         try:
             conn = self.get_db_connection()
-            cursor = conn.cursor()
-            
-            # Sample users
-            sample_users = [
-                ("user_001", "john@example.com", "+1234567890", "active_user", 0.85),
-                ("user_002", "jane@example.com", "+1234567891", "new_user", 0.30),
-                ("user_003", "mike@example.com", "+1234567892", "cart_abandoner", 0.60),
-                ("user_004", "sarah@example.com", "+1234567893", "inactive_user", 0.20),
-                ("user_005", "alex@example.com", "+1234567894", "repeat_buyer", 0.90)
-            ]
-            
-            for user_id, email, phone, segment, engagement in sample_users:
-                cursor.execute("""
+            try:
+                cursor = conn.cursor()
+                
+                # Sample users
+                sample_users = [
+                    ("user_001", "john@example.com", "+1234567890", "active_user", 0.85),
+                    ("user_002", "jane@example.com", "+1234567891", "new_user", 0.30),
+                    ("user_003", "mike@example.com", "+1234567892", "cart_abandoner", 0.60),
+                    ("user_004", "sarah@example.com", "+1234567893", "inactive_user", 0.20),
+                    ("user_005", "alex@example.com", "+1234567894", "repeat_buyer", 0.90)
+                ]
+                
+                execute_values(cursor, """
                     INSERT INTO users (user_id, email, phone, segment, engagement_score)
-                    VALUES (%s, %s, %s, %s, %s)
+                    VALUES %s
                     ON CONFLICT (user_id) DO NOTHING
-                """, (user_id, email, phone, segment, engagement))
-            
-            # Sample products
-            sample_products = [
-                ("prod_001", "GETTO Premium T-Shirt", "clothing", "shirts", 29.99),
-                ("prod_002", "GETTO Denim Jacket", "clothing", "jackets", 79.99),
-                ("prod_003", "GETTO Sneakers", "footwear", "casual", 89.99),
-                ("prod_004", "GETTO Accessories Set", "accessories", "sets", 39.99),
-                ("prod_005", "GETTO Limited Edition Watch", "accessories", "watches", 199.99)
-            ]
-            
-            for prod_id, name, category, subcategory, price in sample_products:
-                cursor.execute("""
+                """, sample_users, page_size=100)
+                
+                # Sample products
+                sample_products = [
+                    ("prod_001", "GETTO Premium T-Shirt", "clothing", "shirts", 29.99),
+                    ("prod_002", "GETTO Denim Jacket", "clothing", "jackets", 79.99),
+                    ("prod_003", "GETTO Sneakers", "footwear", "casual", 89.99),
+                    ("prod_004", "GETTO Accessories Set", "accessories", "sets", 39.99),
+                    ("prod_005", "GETTO Limited Edition Watch", "accessories", "watches", 199.99)
+                ]
+                
+                execute_values(cursor, """
                     INSERT INTO products (product_id, name, category, subcategory, price)
-                    VALUES (%s, %s, %s, %s, %s)
+                    VALUES %s
                     ON CONFLICT (product_id) DO NOTHING
-                """, (prod_id, name, category, subcategory, price))
+                """, sample_products, page_size=100)
+                
+                # Fresh planner statistics so the per-user indexes get picked up right away
+                cursor.execute("ANALYZE users, products, purchases, cart_items, wishlist_items")
+                
+                conn.commit()
+                cursor.close()
+            finally:
+                self.release_db_connection(conn)
+            
+        except Exception as e:
+            logger.error(f"Error inserting sample data: {e}")
+    
+    def bulk_load_products(self, products) -> int:
+        """Bulk load (product_id, name, category, subcategory, price) rows with COPY, skipping existing products"""
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(products)
+        buffer.seek(0)
+        
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            
+            # COPY can't resolve conflicts itself, so stream into a temp table first
+            cursor.execute("""
+                CREATE TEMP TABLE products_staging
+                (LIKE products INCLUDING DEFAULTS)
+                ON COMMIT DROP
+            """)
+            cursor.copy_expert("""
+                COPY products_staging (product_id, name, category, subcategory, price)
+                FROM STDIN WITH CSV
+            """, buffer)
+            cursor.execute("""
+                INSERT INTO products (product_id, name, category, subcategory, price)
+                SELECT product_id, name, category, subcategory, price
+                FROM products_staging
+                ON CONFLICT (product_id) DO NOTHING
+            """)
+            inserted = cursor.rowcount
             
             conn.commit()
             cursor.close()
-            conn.close()
-            
+        finally:
+            self.release_db_connection(conn)
+        
+        logger.info(f"Bulk loaded {inserted} new products")
+        return inserted
+    
+    def refresh_user_segments(self):
+        """Recompute the user_segment_cache view without blocking profile reads"""
+        try:
+            conn = self.get_db_connection()
+            try:
+                cursor = conn.cursor()
+                # Released at commit; another process already refreshing means this one skips
+                cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", (USER_SEGMENT_REFRESH_LOCK_ID,))
+                if cursor.fetchone()[0]:
+                    cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY user_segment_cache")
+                conn.commit()
+                cursor.close()
+            finally:
+                self.release_db_connection(conn)
         except Exception as e:
-            logger.error(f"Error inserting sample data: {e}")
+            logger.error(f"Error refreshing user segments: {e}")
     
-    def load_notification_templates(self):
-        """Load personalized notification templates"""
-        return {
-            NotificationType.WELCOME: [
-                NotificationTemplate(
-                    NotificationType.WELCOME,
-                    "Welcome to GETTO! 🎉",
-                    "Discover your perfect style with exclusive offers just for you!",
-                    "high",
-                    {"discount": 15, "category": "all"}
-                )
-            ],
-            NotificationType.CART_ABANDONMENT: [
-                NotificationTemplate(
-                    NotificationType.CART_ABANDONMENT,
-                    "Complete your GETTO journey! 🛍️",
-                    "Your {item_count} item(s) are waiting - finish your order now!",
-                    "medium",
-                    {"urgency": "medium", "discount": 10}
-                )
-            ],
-            NotificationType.WISHLIST_REMINDER: [
-                NotificationTemplate(
-                    NotificationType.WISHLIST_REMINDER,
-                    "Your favorites are calling! ❤️",
-                    "{product_name} from your wishlist is back in stock!",
-                    "medium",
-                    {"stock_alert": True}
-                )
-            ],
-            NotificationType.REORDER_SUGGESTION: [
-                NotificationTemplate(
-                    NotificationType.REORDER_SUGGESTION,
-                    "Time for your GETTO essentials? 🔄",
-                    "Based on your history, you might need {product_name} again!",
-                    "low",
-                    {"reorder_discount": 5}
-                )
-            ],
-            NotificationType.NEW_PRODUCT_ALERT: [
-                NotificationTemplate(
-                    NotificationType.NEW_PRODUCT_ALERT,
-                    "New {category} collection just dropped! ✨",
-                    "Discover the latest {category} styles perfectly matched to your taste!",
-                    "medium",
-                    {"early_access": True}
-                )
-            ]
-        }
+    def refresh_user_segments_forever(self):
+        """Background loop keeping user_segment_cache at most USER_SEGMENT_REFRESH_INTERVAL seconds old"""
+        while True:
+            time.sleep(USER_SEGMENT_REFRESH_INTERVAL)
+            self.refresh_user_segments()
     
-    def analyze_user_behavior(self, user_id: str) -> UserProfile:
-        """Analyze user behavior and create personalized profile"""
+    def load_product_index(self):
+        """Load the fitted product TF-IDF index, refitting only if the catalog changed"""
         try:
             conn = self.get_db_connection()
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT product_id,
+                           CONCAT_WS(' ', name, category, subcategory, description, tags::text)
+                    FROM products
+                    WHERE is_active = true
+                    ORDER BY product_id
+                """)
+                catalog = cursor.fetchall()
+                cursor.close()
+            finally:
+                self.release_db_connection(conn)
             
-            # Get user basic info
-            cursor.execute("""
-                SELECT u.*, 
-                       COUNT(p.id) as total_purchases,
-                       COALESCE(AVG(p.price), 0) as avg_order_value
-                FROM users u
-                LEFT JOIN purchases p ON u.user_id = p.user_id
-                WHERE u.user_id = %s
-                GROUP BY u.user_id
-            """, (user_id,))
+            product_ids = [row[0] for row in catalog]
+            product_texts = [row[1] for row in catalog]
+            if os.path.exists(PRODUCT_INDEX_PATH):
+                saved = joblib.load(PRODUCT_INDEX_PATH)
+                if saved.get('catalog_digest') == catalog_digest(product_ids, product_texts):
+                    self.tfidf = saved['tfidf']
+                    self.product_ids = product_ids
+                    self.product_matrix = saved['product_matrix']
+                    logger.info(f"Loaded product TF-IDF index for {len(product_ids)} products")
+                    return
             
-            user_data = cursor.fetchone()
-            if not user_data:
-                return None
+            self.fit_product_index(product_ids, product_texts)
             
-            # Get cart items
-            cursor.execute("""
-                SELECT ci.*, p.name, p.price, p.category
-                FROM cart_items ci
-                JOIN products p ON ci.product_id = p.product_id
-                WHERE ci.user_id = %s
-            """, (user_id,))
-            cart_items = cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Error loading product TF-IDF index: {e}")
+    
+    def fit_product_index(self, product_ids: List[str], product_texts: List[str]):
+        """Fit the product TF-IDF index on the catalog and save it for the next boot"""
+        tfidf = TfidfVectorizer(dtype=np.float32, ngram_range=(1, 2), min_df=2, max_df=0.95, sublinear_tf=True)
+        # Rows come out L2-normalized, so linear_kernel against them is cosine similarity
+        product_matrix = tfidf.fit_transform(product_texts)
+        
+        self.tfidf = tfidf
+        self.product_ids = product_ids
+        self.product_matrix = product_matrix
+        
+        os.makedirs(os.path.dirname(PRODUCT_INDEX_PATH) or '.', exist_ok=True)
+        joblib.dump({'tfidf': tfidf, 'product_ids': product_ids, 'product_matrix': product_matrix,
+                     'catalog_digest': catalog_digest(product_ids, product_texts)},
+                    PRODUCT_INDEX_PATH)
+        logger.info(f"Fitted product TF-IDF index for {len(product_ids)} products "
+                    f"({len(tfidf.vocabulary_)} terms)")
+    
+    def product_similarities(self, texts: List[str]):
+        """Similarity of each text to every catalog product, using the already fitted index"""
+        return linear_kernel(self.tfidf.transform(texts), self.product_matrix)
+    
+    def recommend_products_bulk(self, user_profiles: List[UserProfile], k: int = 5) -> Dict[str, List[str]]:
+        """Top k catalog products for many users, scored chunk by chunk with sparse multiplies"""
+        recommendations = {profile.user_id: [] for profile in user_profiles}
+        if self.product_matrix is None or not self.product_ids:
+            return recommendations
+        
+        product_ids = np.asarray(self.product_ids)
+        k = min(k, len(product_ids))
+        if k <= 0:
+            return recommendations
+        
+        for start in range(0, len(user_profiles), SIMILARITY_CHUNK_SIZE):
+            chunk = user_profiles[start:start + SIMILARITY_CHUNK_SIZE]
+            scores = self.product_similarities([' '.join(p.preferred_categories) for p in chunk])
             
-            # Get wishlist items
-            cursor.execute("""
-                SELECT wi.*, p.name, p.price, p.category
-                FROM wishlist_items wi
-                JOIN products p ON wi.product_id = p.product_id
-                WHERE wi.user_id = %s
-            """, (user_id,))
-            wishlist_items = cursor.fetchall()
+            # Partial sort for the top k per row, then order just those k
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            top = np.take_along_axis(top, np.argsort(-top_scores, axis=1), axis=1)
             
-            # Determine user segment
-            segment = self.determine_user_segment(user_data, cart_items, wishlist_items)
+            for profile, row in zip(chunk, top):
+                recommendations[profile.user_id] = list(product_ids[row])
+        
+        return recommendations
+    
+    def analyze_user_behavior(self, user_id: str) -> UserProfile:
+        """Analyze user behavior and create personalized profile, cached for USER_PROFILE_CACHE_TTL seconds"""
+        now = time.monotonic()
+        with self._user_profiles_lock:
+            cached = self.user_profiles.get(user_id)
+        if cached and cached[0] > now:
+            return cached[1]
+        
+        profile = self.build_user_profile(user_id)
+        if profile:
+            self.cache_user_profile(profile, now)
+        return profile
+    
+    def analyze_users_bulk(self, user_ids: List[str]) -> Dict[str, UserProfile]:
+        """Profiles for many users, building every uncached one in a single query"""
+        now = time.monotonic()
+        profiles = {}
+        with self._user_profiles_lock:
+            for user_id in user_ids:
+                cached = self.user_profiles.get(user_id)
+                if cached and cached[0] > now:
+                    profiles[user_id] = cached[1]
+        missing = [user_id for user_id in dict.fromkeys(user_ids) if user_id not in profiles]
+        if not missing:
+            return profiles
+        
+        try:
+            conn = self.get_db_connection()
+            try:
+                cursor = conn.cursor(cursor_factory=RealDictCursor)
+                cursor.execute("""
+                    WITH purchase_stats AS (
+                        SELECT user_id,
+                               COUNT(*) as total_purchases,
+                               AVG(price) as avg_order_value
+                        FROM purchases
+                        WHERE user_id = ANY(%(user_ids)s)
+                        GROUP BY user_id
+                    ), cart AS (
+                        SELECT c.user_id, json_agg(row_to_json(c)) as cart_items
+                        FROM (
+                            SELECT ci.*, p.name, p.price, p.category
+                            FROM cart_items ci
+                            JOIN products p ON ci.product_id = p.product_id
+                            WHERE ci.user_id = ANY(%(user_ids)s)
+                        ) c
+                        GROUP BY c.user_id
+                    ), wishlist AS (
+                        SELECT w.user_id, json_agg(row_to_json(w)) as wishlist_items
+                        FROM (
+                            SELECT wi.*, p.name, p.price, p.category
+                            FROM wishlist_items wi
+                            JOIN products p ON wi.product_id = p.product_id
+                            WHERE wi.user_id = ANY(%(user_ids)s)
+                        ) w
+                        GROUP BY w.user_id
+                    ), categories AS (
+                        SELECT user_id, array_agg(category ORDER BY frequency DESC) as preferred_categories
+                        FROM (
+                            SELECT pur.user_id, p.category, COUNT(*) as frequency,
+                                   ROW_NUMBER() OVER (PARTITION BY pur.user_id ORDER BY COUNT(*) DESC) as rank
+                            FROM purchases pur
+                            JOIN products p ON pur.product_id = p.product_id
+                            WHERE pur.user_id = ANY(%(user_ids)s)
+                            GROUP BY pur.user_id, p.category
+                        ) ranked_categories
+                        WHERE rank <= 3
+                        GROUP BY user_id
+                    )
+                    SELECT u.user_id, u.created_at, u.last_activity, u.notification_preferences, u.engagement_score,
+                           COALESCE(purchase_stats.total_purchases, 0) as total_purchases,
+                           COALESCE(purchase_stats.avg_order_value, 0) as avg_order_value,
+                           COALESCE(cart.cart_items, '[]'::json) as cart_items,
+                           COALESCE(wishlist.wishlist_items, '[]'::json) as wishlist_items,
+                           COALESCE(categories.preferred_categories, '{}') as preferred_categories,
+                           sc.segment as cached_segment
+                    FROM users u
+                    LEFT JOIN user_segment_cache sc ON sc.user_id = u.user_id
+                    LEFT JOIN purchase_stats ON purchase_stats.user_id = u.user_id
+                    LEFT JOIN cart ON cart.user_id = u.user_id
+                    LEFT JOIN wishlist ON wishlist.user_id = u.user_id
+                    LEFT JOIN categories ON categories.user_id = u.user_id
+                    WHERE u.user_id = ANY(%(user_ids)s)
+                """, {'user_ids': missing})
+                rows = cursor.fetchall()
+                cursor.close()
+            finally:
+                self.release_db_connection(conn)
             
-            # Calculate preferred categories
-            cursor.execute("""
-                SELECT p.category, COUNT(*) as frequency
-                FROM purchases pur
-                JOIN products p ON pur.product_id = p.product_id
-                WHERE pur.user_id = %s
-                GROUP BY p.category
-                ORDER BY frequency DESC
-                LIMIT 3
-            """, (user_id,))
-            preferred_categories = [row['category'] for row in cursor.fetchall()]
+            # One wall-clock read segments the whole batch consistently
+            segmented_at = datetime.now()
+            for row in rows:
+                profile = self.profile_from_row(row['user_id'], row, segmented_at)
+                self.cache_user_profile(profile, now)
+                profiles[profile.user_id] = profile
             
-            cursor.close()
-            conn.close()
+        except Exception as e:
+            logger.error(f"Error analyzing users in bulk: {e}")
+        
+        return profiles
+    
+    def cache_user_profile(self, profile: UserProfile, now: float):
+        """Remember a built profile for USER_PROFILE_CACHE_TTL seconds"""
+        with self._user_profiles_lock:
+            if len(self.user_profiles) >= USER_PROFILE_CACHE_SIZE:
+                # Evict the oldest entry; dicts keep insertion order
+                self.user_profiles.pop(next(iter(self.user_profiles)), None)
+            self.user_profiles[profile.user_id] = (now + USER_PROFILE_CACHE_TTL, profile)
+    
+    def invalidate_user_profile(self, user_id: str):
+        """Drop a cached profile after the user's data changes"""
+        with self._user_profiles_lock:
+            self.user_profiles.pop(user_id, None)
+    
+    def build_user_profile(self, user_id: str) -> UserProfile:
+        """Build a user's profile from the database"""
+        try:
+            conn = self.get_db_connection()
+            try:
+                cursor = conn.cursor(cursor_factory=RealDictCursor)
+                
+                # User info, purchase stats, cart, wishlist and top categories in one round-trip
+                execute_prepared(cursor, 'user_profile', (user_id,))
+                user_data = cursor.fetchone()
+                cursor.close()
+            finally:
+                self.release_db_connection(conn)
+            
+            if not user_data:
+                return None
             
-            return UserProfile(
-                user_id=user_id,
-                segment=segment,
-                total_purchases=user_data['total_purchases'],
-                avg_order_value=float(user_data['avg_order_value']),
-                last_activity=user_data['last_activity'],
-                preferred_categories=preferred_categories,
-                cart_items=[dict(item) for item in cart_items],
-                wishlist_items=[dict(item) for item in wishlist_items],
-                notification_preferences=user_data['notification_preferences'],
-                engagement_score=float(user_data['engagement_score'])
-            )
+            return self.profile_from_row(user_id, user_data)
             
         except Exception as e:
             logger.error(f"Error analyzing user behavior: {e}")
             return None
     
-    def determine_user_segment(self, user_data, cart_items, wishlist_items) -> UserSegment:
-        """Determine user segment based on behavior"""
-        days_since_created = (datetime.now() - user_data['created_at']).days
-        days_since_activity = (datetime.now() - user_data['last_activity']).days
+    def profile_from_row(self, user_id: str, user_data, now: Optional[datetime] = None) -> UserProfile:
+        """Turn a user_profile query row into a segmented UserProfile"""
+        cart_items = user_data['cart_items']
+        wishlist_items = user_data['wishlist_items']
+        
+        # Use the precomputed segment; users added since the last refresh are segmented here
+        if user_data['cached_segment']:
+            segment = UserSegment(user_data['cached_segment'])
+        else:
+            segment = self.determine_user_segment(user_data, cart_items, wishlist_items, now)
+        
+        return UserProfile(
+            user_id=user_id,
+            segment=segment,
+            total_purchases=user_data['total_purchases'],
+            avg_order_value=float(user_data['avg_order_value']),
+            last_activity=user_data['last_activity'],
+            preferred_categories=user_data['preferred_categories'],
+            cart_items=cart_items,
+            wishlist_items=wishlist_items,
+            notification_preferences=user_data['notification_preferences'],
+            engagement_score=float(user_data['engagement_score'])
+        )
+    
+    def determine_user_segment(self, user_data, cart_items, wishlist_items,
+                               now: Optional[datetime] = None) -> UserSegment:
+        """Determine user segment based on behavior, as of now (read once per batch by bulk callers)"""
+        if now is None:
+            now = datetime.now()
+        days_since_created = (now - user_data['created_at']).days
+        days_since_activity = (now - user_data['last_activity']).days
         total_purchases = user_data['total_purchases'] or 0
         
         # Segmentation logic
@@ -447,7 +941,7 @@ class PersonalizedNotificationEngine:
     def generate_personalized_notification(self, user_profile: UserProfile, 
                                          notification_type: NotificationType) -> Dict:
         """Generate personalized notification content"""
-        templates = self.notification_templates.get(notification_type, [])
+        templates = self.notification_templates.get(notification_type, ())
         if not templates:
             return None
         
@@ -465,7 +959,7 @@ class PersonalizedNotificationEngine:
             "personalization_score": self.calculate_personalization_score(user_profile, template),
             "metadata": {
                 "user_segment": user_profile.segment.value,
-                "template_data": template.personalization_data,
+                "template_data": dict(template.personalization_data),
                 "timestamp": datetime.now().isoformat()
             }
         }
@@ -486,25 +980,111 @@ class PersonalizedNotificationEngine:
         # Personalization based on notification type
         if template.type == NotificationType.CART_ABANDONMENT:
             item_count = len(user_profile.cart_items)
-            body = body.format(item_count=item_count)
+            body = render_format(template.compiled_body, {"item_count": item_count})
         
         elif template.type == NotificationType.WISHLIST_REMINDER:
             if user_profile.wishlist_items:
                 product_name = user_profile.wishlist_items[0]['name']
-                body = body.format(product_name=product_name)
+                body = render_format(template.compiled_body, {"product_name": product_name})
         
         elif template.type == NotificationType.NEW_PRODUCT_ALERT:
             category = user_profile.preferred_categories[0] if user_profile.preferred_categories else "fashion"
-            title = title.format(category=category)
-            body = body.format(category=category)
+            title = render_format(template.compiled_title, {"category": category})
+            body = render_format(template.compiled_body, {"category": category})
         
         elif template.type == NotificationType.REORDER_SUGGESTION:
             # Get most frequently purchased product
             if user_profile.preferred_categories:
-                body = body.format(product_name=f"{user_profile.preferred_categories[0]} items")
+                body = render_format(template.compiled_body,
+                                     {"product_name": f"{user_profile.preferred_categories[0]} items"})
         
         return {"title": title, "body": body}
     
+    def send_personalized_notification(self, job_id: int, user_id: str, notification_type: NotificationType):
+        """Build and send a queued personalized notification, recording the outcome on its job row"""
+        try:
+            user_profile = self.analyze_user_behavior(user_id)
+            notification = self.generate_personalized_notification(user_profile, notification_type) if user_profile else None
+            if not notification:
+                logger.warning(f"No {notification_type.value} notification could be built for user {user_id}")
+                self.finish_notification_job(job_id, 'failed')
+                return
+            
+            conn = self.get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT fcm_token FROM fcm_devices
+                    WHERE user_id = %s AND is_active = true
+                """, (user_id,))
+                tokens = [row[0] for row in cursor.fetchall()]
+                cursor.close()
+            finally:
+                self.release_db_connection(conn)
+            
+            messages = [
+                messaging.Message(
+                    notification=messaging.Notification(title=notification["title"], body=notification["body"]),
+                    data={"type": notification["type"], "job_id": str(job_id)},
+                    android=messaging.AndroidConfig(priority='high' if notification["priority"] == 'high' else 'normal'),
+                    token=token
+                )
+                for token in tokens
+            ]
+            responses = self.send_personalized_batch(messages)
+            successful_sends = sum(1 for response in responses if response.success)
+            
+            logger.info(f"Personalized notification {job_id}: {successful_sends}/{len(messages)} devices reached")
+            self.finish_notification_job(job_id, 'sent' if successful_sends else 'failed', notification)
+            
+        except Exception as e:
+            logger.error(f"Error sending personalized notification {job_id}: {e}")
+            self.finish_notification_job(job_id, 'failed')
+    
+    def finish_notification_job(self, job_id: int, status: str, notification: Optional[Dict] = None):
+        """Record a personalized send's final status; only sent notifications are added to notification_history"""
+        try:
+            conn = self.get_db_connection()
+            try:
+                cursor = conn.cursor()
+                history_id = None
+                if status == 'sent' and notification:
+                    cursor.execute("""
+                        INSERT INTO notification_history
+                            (user_id, notification_type, title, body, personalization_score, metadata)
+                        SELECT user_id, notification_type, %s, %s, %s, %s
+                        FROM notification_jobs WHERE id = %s
+                        RETURNING id
+                    """, (notification["title"], notification["body"],
+                          notification["personalization_score"], Json(notification["metadata"]), job_id))
+                    row = cursor.fetchone()
+                    history_id = row[0] if row else None
+                cursor.execute("""
+                    UPDATE notification_jobs
+                    SET status = %s, finished_at = CURRENT_TIMESTAMP, history_id = %s
+                    WHERE id = %s
+                """, (status, history_id, job_id))
+                conn.commit()
+                cursor.close()
+            finally:
+                self.release_db_connection(conn)
+        except Exception as e:
+            logger.error(f"Error recording status of notification {job_id}: {e}")
+    
+    def send_personalized_batch(self, messages: List[messaging.Message]) -> List[messaging.SendResponse]:
+        """Send messages in FCM-sized batches, one batch at a time, returning responses in message order"""
+        # Type-check every message before the first batch goes out; field validation is left to the SDK
+        for i, message in enumerate(messages):
+            if not isinstance(message, messaging.Message):
+                raise ValueError(f"messages[{i}] is not a messaging.Message")
+        
+        # send_each already sends a batch's messages on one thread each, so batches run
+        # one after another to keep at most FCM_MULTICAST_LIMIT requests in flight
+        responses = []
+        for start in range(0, len(messages), FCM_MULTICAST_LIMIT):
+            responses.extend(messaging.send_each(messages[start:start + FCM_MULTICAST_LIMIT]).responses)
+        return responses
+    
     def calculate_personalization_score(self, user_profile: UserProfile, 
                                       template: NotificationTemplate) -> float:
         """Calculate how well personalized the notification is"""
@@ -521,10 +1101,94 @@ class PersonalizedNotificationEngine:
             score += 0.1
         
         return min(score, 1.0)
+    
+    def score_users_bulk(self, user_ids: List[str], notification_type: NotificationType) -> np.recarray:
+        """Segment and score many users at once for a campaign, with one query and vectorized rules"""
+        rows = []
+        if user_ids:
+            conn = self.get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT u.user_id, u.created_at, u.last_activity, u.engagement_score,
+                           (SELECT COUNT(*) FROM purchases p WHERE p.user_id = u.user_id) as total_purchases,
+                           (SELECT COUNT(*) FROM cart_items ci WHERE ci.user_id = u.user_id) as cart_count,
+                           EXISTS (
+                               SELECT 1 FROM purchases pur
+                               JOIN products p ON pur.product_id = p.product_id
+                               WHERE pur.user_id = u.user_id
+                           ) as has_preferred_categories
+                    FROM users u
+                    WHERE u.user_id = ANY(%s)
+                """, (list(user_ids),))
+                rows = cursor.fetchall()
+                cursor.close()
+            finally:
+                self.release_db_connection(conn)
+        
+        scored = np.empty(len(rows), dtype=SCORED_USER_DTYPE).view(np.recarray)
+        if not rows:
+            return scored
+        
+        # Column arrays straight from the fetched tuples
+        (ids, created_at, last_activity, engagement_score,
+         total_purchases, cart_count, has_preferred_categories) = zip(*rows)
+        
+        # Same rules, in the same order, as determine_user_segment
+        now = np.datetime64(datetime.now(), 'us')
+        one_day = np.timedelta64(1, 'D')
+        days_since_created = (now - np.array(created_at, dtype='datetime64[us]')) // one_day
+        days_since_activity = (now - np.array(last_activity, dtype='datetime64[us]')) // one_day
+        total_purchases = np.array(total_purchases, dtype=np.int64)
+        scored.user_id = ids
+        scored.segment = np.select(
+            [
+                days_since_created <= 7,
+                days_since_activity > 30,
+                (np.array(cart_count, dtype=np.int64) > 0) & (days_since_activity <= 1),
+                total_purchases >= 10,
+                total_purchases >= 3
+            ],
+            [
+                UserSegment.NEW_USER.value,
+                UserSegment.INACTIVE_USER.value,
+                UserSegment.CART_ABANDONER.value,
+                UserSegment.VIP_USER.value,
+                UserSegment.REPEAT_BUYER.value
+            ],
+            default=UserSegment.ACTIVE_USER.value
+        )
+        
+        # Same factors as calculate_personalization_score
+        type_boost = 0.1 if notification_type in [NotificationType.CART_ABANDONMENT,
+                                                  NotificationType.WISHLIST_REMINDER] else 0.0
+        score = (0.5
+                 + 0.2 * np.array(has_preferred_categories, dtype=np.float64)
+                 + 0.2 * (np.array(engagement_score, dtype=np.float64) > 0.7)
+                 + type_boost)
+        scored.personalization_score = np.minimum(score, 1.0)
+        
+        return scored
 
 # Global notification engine instance
 notification_engine = PersonalizedNotificationEngine(DB_CONFIG)
 
+# Background threads that do the FCM work for /send-personalized-notification
+send_executor = ThreadPoolExecutor(max_workers=NOTIFICATION_SEND_WORKERS)
+
+def get_request_db_connection():
+    """Borrow one pooled connection for the current request"""
+    if 'db_conn' not in g:
+        g.db_conn = notification_engine.get_db_connection()
+    return g.db_conn
+
+@app.teardown_request
+def release_request_db_connection(exc):
+    """Hand the request's connection back to the pool, rolling back anything uncommitted"""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        notification_engine.release_db_connection(conn)
+
 # Flask routes
 @app.route('/')
 def home():
@@ -562,22 +1226,14 @@ def register_user():
         if not user_id:
             return jsonify({"error": "user_id is required"}), 400
         
-        conn = notification_engine.get_db_connection()
+        conn = get_request_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute("""
-            INSERT INTO users (user_id, email, phone, last_activity)
-            VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
-            ON CONFLICT (user_id) 
-            DO UPDATE SET 
-                email = EXCLUDED.email,
-                phone = EXCLUDED.phone,
-                last_activity = CURRENT_TIMESTAMP
-        """, (user_id, email, phone))
+        execute_prepared(cursor, 'upsert_user', (user_id, email, phone))
         
         conn.commit()
         cursor.close()
-        conn.close()
+        notification_engine.invalidate_user_profile(user_id)
         
         return jsonify({
             "status": "success",
@@ -602,22 +1258,13 @@ def register_device():
         if not all([user_id, device_id, fcm_token]):
             return jsonify({"error": "user_id, device_id, and fcm_token are required"}), 400
         
-        conn = notification_engine.get_db_connection()
+        conn = get_request_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute("""
-            INSERT INTO fcm_devices (user_id, device_id, fcm_token, platform, last_active)
-            VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
-            ON CONFLICT (device_id)
-            DO UPDATE SET 
-                fcm_token = EXCLUDED.fcm_token,
-                last_active = CURRENT_TIMESTAMP,
-                is_active = true
-        """, (user_id, device_id, fcm_token, platform))
+        execute_prepared(cursor, 'upsert_device', (user_id, device_id, fcm_token, platform))
         
         conn.commit()
         cursor.close()
-        conn.close()
         
         return jsonify({
             "status": "success",
@@ -630,6 +1277,52 @@ def register_device():
         logger.error(f"Error registering device: {e}")
         return jsonify({"error": f"Failed to register device: {str(e)}"}), 500
 
+@app.route('/send-personalized-notification', methods=['POST'])
+def send_personalized_notification():
+    """Queue a personalized notification for a user and return its job id without waiting for FCM"""
+    if not notification_engine.firebase_initialized:
+        return jsonify({"error": "Firebase not initialized"}), 500
+    
+    try:
+        data = request.get_json()
+        user_id = data.get('user_id')
+        notification_type = data.get('notification_type')
+        
+        if not all([user_id, notification_type]):
+            return jsonify({"error": "user_id and notification_type are required"}), 400
+        
+        try:
+            notification_type = NotificationType(notification_type)
+        except ValueError:
+            return jsonify({"error": f"Unknown notification_type: {notification_type}"}), 400
+        
+        conn = get_request_db_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            INSERT INTO notification_jobs (user_id, notification_type)
+            VALUES (%s, %s)
+            RETURNING id
+        """, (user_id, notification_type.value))
+        job_id = cursor.fetchone()[0]
+        
+        conn.commit()
+        cursor.close()
+        
+        send_executor.submit(notification_engine.send_personalized_notification, job_id, user_id, notification_type)
+        
+        return jsonify({
+            "status": "queued",
+            "message": "Personalized notification queued",
+            "job_id": job_id,
+            "user_id": user_id,
+            "notification_type": notification_type.value
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Error queueing personalized notification: {e}")
+        return jsonify({"error": f"Failed to queue notification: {str(e)}"}), 500
+
 if __name__ == '__main__':
     port = int(os.getenv('FLASK_PORT', 5000))
     debug = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
@@ -0,0 +1,64 @@
+"""
+Shared Flask and Firebase helpers for the notification servers
+Used by app_simple.py, app_with_postgres.py and personalized_notification_system.py
+"""
+
+from flask.json.provider import DefaultJSONProvider
+import firebase_admin
+from firebase_admin import messaging
+from requests.adapters import HTTPAdapter
+import orjson
+
+# FCM accepts at most this many tokens per multicast request
+FCM_MULTICAST_LIMIT = 500
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Serialize jsonify responses with orjson instead of the stdlib encoder"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+def widen_fcm_connection_pool():
+    """Let concurrent multicast senders reuse TLS connections to FCM"""
+    # send_each* sends every message on its own thread over this requests session (HTTP/1.1),
+    # so each in-flight message needs its own pooled connection
+    service = getattr(messaging, '_get_messaging_service', lambda app: None)(firebase_admin.get_app())
+    session = getattr(getattr(service, '_client', None), 'session', None)
+    if session is None:
+        return False
+    # Keep the SDK's retry policy (backoff on FCM 500/503, POSTs included)
+    retries = session.get_adapter('https://').max_retries
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=FCM_MULTICAST_LIMIT, max_retries=retries)
+    session.mount('https://', adapter)
+    return True
+
+def preparing_connection(statements):
+    """Connection class for a pool whose connections remember which of statements they have prepared"""
+    # Imported here so app_simple, which has no database, doesn't need psycopg2 installed
+    import psycopg2.extensions
+    
+    class PreparingConnection(psycopg2.extensions.connection):
+        """Connection that remembers which of its server's PREPARE statements it has already run"""
+        
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.statements = statements
+            self.prepared = set()
+    
+    return PreparingConnection
+
+def execute_prepared(cursor, name, params=()):
+    """Run a prepared statement, preparing it first if this connection has not yet"""
+    conn = cursor.connection
+    if name not in conn.prepared:
+        cursor.execute(conn.statements[name])
+        conn.prepared.add(name)
+    
+    if params:
+        placeholders = ", ".join(["%s"] * len(params))
+        cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+    else:
+        cursor.execute(f"EXECUTE {name}")
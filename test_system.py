@@ -5,7 +5,9 @@ Tests the complete flow: Database → Firebase → Android Device
 """
 
 import requests
-import json
+from _testlib import SESSION, JSON_HEADERS, cached_get, json_body, log, response_body, warm_up
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 import os
 from dotenv import load_dotenv
 
@@ -14,129 +16,153 @@ load_dotenv()
 # Server configuration
 SERVER_URL = "http://localhost:5000"
 
-def test_server_status():
+# Endpoint URLs, built once
+URL_ROOT = f"{SERVER_URL}/"
+URL_TEST_DB = f"{SERVER_URL}/test-db"
+URL_NOTIFICATION_PREVIEW = f"{SERVER_URL}/notifications?limit=3"
+URL_NOTIFICATION_COUNT = f"{SERVER_URL}/notifications/count"
+URL_REGISTER = f"{SERVER_URL}/register-device"
+URL_SEND = f"{SERVER_URL}/send-notification"
+
+# Dummy FCM token for testing (replace with real token from Android app)
+DUMMY_TOKEN = "dummy_fcm_token_for_testing_replace_with_real_token"
+
+# The request bodies never change, so they are encoded once
+REGISTER_BODY = orjson.dumps({
+    "fcm_token": DUMMY_TOKEN,
+    "device_id": "test_android_device"
+})
+SEND_BODY = orjson.dumps({
+    "notification_id": 1,  # Use first notification from database
+    "target_token": DUMMY_TOKEN
+})
+
+def prefetch(*urls):
+    """Start GETs for independent read-only endpoints at once; each future holds the response"""
+    executor = ThreadPoolExecutor(max_workers=len(urls))
+    futures = [executor.submit(cached_get, url) for url in urls]
+    executor.shutdown(wait=False)
+    return futures
+
+def test_server_status(prefetched=None):
     """Test if the Flask server is running"""
-    print("🔍 Testing server status...")
+    log.info("🔍 Testing server status...")
     try:
-        response = requests.get(f"{SERVER_URL}/")
+        response = prefetched.result() if prefetched else cached_get(URL_ROOT)
         if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Server is running: {data['message']}")
-            print(f"🔥 Firebase status: {data['firebase_status']}")
+            data = json_body(response)
+            log.info(f"✅ Server is running: {data['message']}")
+            log.info(f"🔥 Firebase status: {data['firebase_status']}")
             return True
         else:
-            print(f"❌ Server error: {response.status_code}")
+            log.info(f"❌ Server error: {response.status_code}")
             return False
     except requests.exceptions.ConnectionError:
-        print("❌ Cannot connect to server. Make sure 'python app.py' is running.")
+        log.info("❌ Cannot connect to server. Make sure 'python app.py' is running.")
         return False
 
-def test_database_connection():
+def test_database_connection(prefetched=None):
     """Test PostgreSQL database connection"""
-    print("\n🗄️ Testing database connection...")
+    log.info("\n🗄️ Testing database connection...")
     try:
-        response = requests.get(f"{SERVER_URL}/test-db")
+        response = prefetched.result() if prefetched else cached_get(URL_TEST_DB)
         if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Database connected: {data['message']}")
-            print(f"📊 PostgreSQL version: {data.get('postgres_version', 'Unknown')}")
+            data = json_body(response)
+            log.info(f"✅ Database connected: {data['message']}")
+            log.info(f"📊 PostgreSQL version: {data.get('postgres_version', 'Unknown')}")
             return True
         else:
-            print(f"❌ Database error: {response.json()}")
+            log.info(f"❌ Database error: {response_body(response)}")
             return False
     except Exception as e:
-        print(f"❌ Database test failed: {e}")
+        log.info(f"❌ Database test failed: {e}")
         return False
 
-def get_sample_notifications():
-    """Fetch sample notifications from database"""
-    print("\n📬 Fetching sample notifications...")
+def get_sample_notifications(prefetched=None):
+    """Fetch a 3-notification preview and the total count from database"""
+    log.info("\n📬 Fetching sample notifications...")
     try:
-        response = requests.get(f"{SERVER_URL}/notifications")
-        if response.status_code == 200:
-            data = response.json()
-            notifications = data['notifications']
-            print(f"✅ Found {data['count']} notifications in database:")
-            for i, notif in enumerate(notifications[:3], 1):  # Show first 3
-                print(f"  {i}. {notif['title']}: {notif['body'][:50]}...")
+        # Only the preview rows are transferred; the count comes from its own small request
+        preview, count = prefetched or prefetch(URL_NOTIFICATION_PREVIEW, URL_NOTIFICATION_COUNT)
+        response, count_response = preview.result(), count.result()
+        if response.status_code == 200 and count_response.status_code == 200:
+            notifications = json_body(response)['notifications']
+            log.info(f"✅ Found {json_body(count_response)['count']} notifications in database:")
+            for i, notif in enumerate(notifications, 1):
+                log.info(f"  {i}. {notif['title']}: {notif['body'][:50]}...")
             return notifications
         else:
-            print(f"❌ Failed to fetch notifications: {response.json()}")
+            failed = response if response.status_code != 200 else count_response
+            log.info(f"❌ Failed to fetch notifications: {response_body(failed)}")
             return []
     except Exception as e:
-        print(f"❌ Error fetching notifications: {e}")
+        log.info(f"❌ Error fetching notifications: {e}")
         return []
 
 def simulate_device_registration():
     """Simulate Android device registration"""
-    print("\n📱 Simulating device registration...")
-    
-    # Dummy FCM token for testing (replace with real token from Android app)
-    dummy_token = "dummy_fcm_token_for_testing_replace_with_real_token"
-    
-    data = {
-        "fcm_token": dummy_token,
-        "device_id": "test_android_device"
-    }
+    log.info("\n📱 Simulating device registration...")
     
     try:
-        response = requests.post(f"{SERVER_URL}/register-device", json=data)
+        response = SESSION.post(URL_REGISTER, data=REGISTER_BODY, headers=JSON_HEADERS)
         if response.status_code == 200:
-            result = response.json()
-            print(f"✅ Device registered: {result['message']}")
+            result = json_body(response)
+            log.info(f"✅ Device registered: {result['message']}")
             return True
         else:
-            print(f"❌ Registration failed: {response.json()}")
+            log.info(f"❌ Registration failed: {response_body(response)}")
             return False
     except Exception as e:
-        print(f"❌ Registration error: {e}")
+        log.info(f"❌ Registration error: {e}")
         return False
 
 def test_notification_sending():
     """Test sending notification using database content"""
-    print("\n🔔 Testing notification sending...")
-    
-    # Send notification using stored database content
-    data = {
-        "notification_id": 1,  # Use first notification from database
-        "target_token": "dummy_fcm_token_for_testing_replace_with_real_token"
-    }
+    log.info("\n🔔 Testing notification sending...")
     
+    # Send notification using stored database content (SEND_BODY)
     try:
-        response = requests.post(f"{SERVER_URL}/send-notification", json=data)
+        response = SESSION.post(URL_SEND, data=SEND_BODY, headers=JSON_HEADERS)
         if response.status_code == 200:
-            result = response.json()
-            print(f"✅ Notification sent: {result['message']}")
-            print(f"📊 Successful sends: {result['successful_sends']}")
-            print(f"❌ Failed sends: {result['failed_sends']}")
+            result = json_body(response)
+            log.info(f"✅ Notification sent: {result['message']}")
+            log.info(f"📊 Successful sends: {result['successful_sends']}")
+            log.info(f"❌ Failed sends: {result['failed_sends']}")
             return True
         else:
-            print(f"❌ Send failed: {response.json()}")
+            log.info(f"❌ Send failed: {response_body(response)}")
             return False
     except Exception as e:
-        print(f"❌ Send error: {e}")
+        log.info(f"❌ Send error: {e}")
         return False
 
 def main():
     """Run all tests"""
-    print("🚀 FCM Push Notification System - Test Suite")
-    print("=" * 50)
+    log.info("🚀 FCM Push Notification System - Test Suite")
+    log.info("=" * 50)
+    
+    # Open a pooled connection before the first timed test
+    warm_up(SERVER_URL)
+    
+    # The read-only probes don't depend on each other, so their requests overlap;
+    # results are still checked and reported in order
+    status, database, preview, count = prefetch(URL_ROOT, URL_TEST_DB, URL_NOTIFICATION_PREVIEW, URL_NOTIFICATION_COUNT)
     
     # Test server
-    if not test_server_status():
-        print("\n❌ Server test failed. Please start the server first:")
-        print("   python app.py")
+    if not test_server_status(status):
+        log.info("\n❌ Server test failed. Please start the server first:")
+        log.info("   python app.py")
         return
     
     # Test database
-    if not test_database_connection():
-        print("\n❌ Database test failed. Check your .env file and ensure PostgreSQL is running.")
+    if not test_database_connection(database):
+        log.info("\n❌ Database test failed. Check your .env file and ensure PostgreSQL is running.")
         return
     
     # Get notifications
-    notifications = get_sample_notifications()
+    notifications = get_sample_notifications((preview, count))
     if not notifications:
-        print("\n❌ No notifications found. Run setup_database.py first.")
+        log.info("\n❌ No notifications found. Run setup_database.py first.")
         return
     
     # Test device registration
@@ -145,14 +171,14 @@ def main():
     # Test notification sending
     test_notification_sending()
     
-    print("\n" + "=" * 50)
-    print("🎉 System test complete!")
-    print("\n📱 Next Steps:")
-    print("1. Open Android app in Android Studio")
-    print("2. Add google-services.json to app folder")
-    print("3. Run the app on your device")
-    print("4. Get FCM token and register device")
-    print("5. Send real notifications to your device!")
+    log.info("\n" + "=" * 50)
+    log.info("🎉 System test complete!")
+    log.info("\n📱 Next Steps:")
+    log.info("1. Open Android app in Android Studio")
+    log.info("2. Add google-services.json to app folder")
+    log.info("3. Run the app on your device")
+    log.info("4. Get FCM token and register device")
+    log.info("5. Send real notifications to your device!")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
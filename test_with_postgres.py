@@ -4,186 +4,211 @@ Test script for FCM Push Notification System with PostgreSQL
 Run this after starting the Flask server to test the functionality
 """
 
-import requests
-import json
-import time
+from _testlib import SESSION, JSON_HEADERS, json_body, log, response_body, warm_up
+import orjson
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 
 # Configuration
 BASE_URL = "http://localhost:5000"
 TEST_FCM_TOKEN = "YOUR_FCM_TOKEN_HERE"  # Replace with actual FCM token from Android app
 
-def test_server_status():
-    """Test if server is running"""
-    print("🔄 Testing server status...")
-    try:
-        response = requests.get(f"{BASE_URL}/")
-        if response.status_code == 200:
-            data = response.json()
-            print("✅ Server is running")
-            print(f"   Firebase: {data['firebase_status']}")
-            print(f"   Database: {data['database_status']}")
-            return True
-        else:
-            print(f"❌ Server responded with status {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ Server connection failed: {e}")
-        return False
+# Checked once at import; real FCM registration tokens are well over 140 characters
+VALID_FCM_TOKEN = TEST_FCM_TOKEN != "YOUR_FCM_TOKEN_HERE" and len(TEST_FCM_TOKEN) >= 140
 
-def test_database_connection():
-    """Test database connection"""
-    print("\n🔄 Testing database connection...")
-    try:
-        response = requests.get(f"{BASE_URL}/test-db")
-        if response.status_code == 200:
-            data = response.json()
-            print("✅ Database connection successful")
-            print(f"   PostgreSQL Version: {data.get('postgresql_version', 'Unknown')}")
-            return True
-        else:
-            print(f"❌ Database test failed with status {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ Database test error: {e}")
-        return False
+# Endpoint URLs, built once
+URL_NOTIFICATIONS = f"{BASE_URL}/notifications"
+URL_HEALTHZ = f"{BASE_URL}/healthz"
+URL_REGISTER = f"{BASE_URL}/register-device"
+URL_SEND = f"{BASE_URL}/send-notification"
+
+# Only the 3 notifications that get printed are sent, alongside the total count
+HEALTHZ_PARAMS = {"include": "notifications,db_version", "limit": 3}
+
+# The create and register request bodies never change, so they are encoded once
+CREATE_NOTIFICATION_BODY = orjson.dumps({
+    "title": "Test Notification",
+    "body": "This is a test notification created via API",
+    "metadata": {"test": True, "created_by": "test_script"},
+    "priority": "high",
+    "type": "test"
+})
+REGISTER_BODY = orjson.dumps({
+    "fcm_token": TEST_FCM_TOKEN,
+    "device_id": "test_device_1"
+})
+
+# Fields shared by every batch send; only target_tokens differs per request
+SEND_FIELDS = {
+    "title": "Test Push Notification",
+    "body": "This notification was sent from the PostgreSQL-integrated server!",
+    "metadata": {"sent_from": "test_script"}
+}
+
+# FCM multicast limit; the server sends each request's tokens as one multicast batch
+BATCH_SIZE = 500
 
-def test_fetch_notifications():
-    """Test fetching notifications from database"""
-    print("\n🔄 Testing notification fetching...")
+# Batch send requests kept in flight at once (the session pool holds 16 connections)
+SEND_WORKERS = 8
+
+def test_health_bundle():
+    """Test server, Firebase and database status with one /healthz call"""
+    log.info("🔄 Checking server, Firebase and database health...")
     try:
-        response = requests.get(f"{BASE_URL}/notifications")
+        response = SESSION.get(URL_HEALTHZ, params=HEALTHZ_PARAMS)
+        # A proxy or crashed server can answer with an HTML error page, so non-JSON stays text
+        data = response_body(response)
         if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Retrieved {data['count']} notifications from database")
-            if data['notifications']:
-                print("   Sample notifications:")
-                for i, notif in enumerate(data['notifications'][:3], 1):
-                    print(f"   {i}. {notif['title']}: {notif['body'][:50]}...")
+            log.info(f"✅ Server is running: {data['server']['message']}")
+            log.info(f"   Firebase: {data['firebase']}")
+            log.info(f"   Database: {data['db']['status']}")
+            log.info(f"   PostgreSQL Version: {data['db'].get('postgresql_version', 'Unknown')}")
+            log.info(f"✅ Retrieved {data['notifications']['count']} notifications from database")
+            if data['notifications']['notifications']:
+                log.info("   Sample notifications:")
+                for i, notif in enumerate(data['notifications']['notifications'], 1):
+                    log.info(f"   {i}. {notif['title']}: {notif['body'][:50]}...")
             return True
         else:
-            print(f"❌ Failed to fetch notifications: {response.status_code}")
+            log.info(f"❌ Health check failed with status {response.status_code}")
+            if isinstance(data, dict):
+                log.info(f"   Database: {data.get('db', {}).get('error', 'Unknown error')}")
+            else:
+                log.info(f"   Response: {data}")
             return False
     except Exception as e:
-        print(f"❌ Notification fetch error: {e}")
+        log.info(f"❌ Server connection failed: {e}")
         return False
 
 def test_create_notification():
     """Test creating a new notification"""
-    print("\n🔄 Testing notification creation...")
+    log.info("\n🔄 Testing notification creation...")
     try:
-        notification_data = {
-            "title": "Test Notification",
-            "body": "This is a test notification created via API",
-            "metadata": {"test": True, "created_by": "test_script"},
-            "priority": "high",
-            "type": "test"
-        }
-        
-        response = requests.post(f"{BASE_URL}/notifications", 
-                               json=notification_data)
+        response = SESSION.post(URL_NOTIFICATIONS, data=CREATE_NOTIFICATION_BODY, headers=JSON_HEADERS)
         if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Created notification with ID: {data['notification_id']}")
+            data = json_body(response)
+            log.info(f"✅ Created notification with ID: {data['notification_id']}")
             return data['notification_id']
         else:
-            print(f"❌ Failed to create notification: {response.status_code}")
+            log.info(f"❌ Failed to create notification: {response.status_code}")
+            log.info(f"   Response: {response_body(response)}")
             return None
     except Exception as e:
-        print(f"❌ Notification creation error: {e}")
+        log.info(f"❌ Notification creation error: {e}")
         return None
 
 def test_device_registration():
     """Test device registration"""
-    print("\n🔄 Testing device registration...")
-    if TEST_FCM_TOKEN == "YOUR_FCM_TOKEN_HERE":
-        print("⚠️  Please update TEST_FCM_TOKEN in the script with your actual FCM token")
-        print("   You can get this from your Android app logs")
+    log.info("\n🔄 Testing device registration...")
+    if not VALID_FCM_TOKEN:
+        log.info("⚠️  Please update TEST_FCM_TOKEN in the script with your actual FCM token")
+        log.info("   You can get this from your Android app logs")
         return False
     
     try:
-        device_data = {
-            "fcm_token": TEST_FCM_TOKEN,
-            "device_id": "test_device_1"
-        }
-        
-        response = requests.post(f"{BASE_URL}/register-device", json=device_data)
+        response = SESSION.post(URL_REGISTER, data=REGISTER_BODY, headers=JSON_HEADERS)
         if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Device registered successfully")
-            print(f"   Total devices: {data['total_devices']}")
+            data = json_body(response)
+            log.info(f"✅ Device registered successfully")
+            log.info(f"   Total devices: {data['total_devices']}")
             return True
         else:
-            print(f"❌ Device registration failed: {response.status_code}")
+            log.info(f"❌ Device registration failed: {response.status_code}")
+            log.info(f"   Response: {response_body(response)}")
             return False
     except Exception as e:
-        print(f"❌ Device registration error: {e}")
+        log.info(f"❌ Device registration error: {e}")
         return False
 
-def test_send_notification():
-    """Test sending notification"""
-    print("\n🔄 Testing notification sending...")
-    if TEST_FCM_TOKEN == "YOUR_FCM_TOKEN_HERE":
-        print("⚠️  Skipping notification send test - FCM token not configured")
+def send_batch(batch):
+    """POST one batch of tokens to /send-notification"""
+    notification_data = {**SEND_FIELDS, "target_tokens": batch}
+    return SESSION.post(URL_SEND, data=orjson.dumps(notification_data), headers=JSON_HEADERS)
+
+def test_send_notification(tokens=None):
+    """Test sending notification, one request per BATCH_SIZE tokens with the requests overlapped"""
+    log.info("\n🔄 Testing notification sending...")
+    if not VALID_FCM_TOKEN:
+        log.info("⚠️  Skipping notification send test - FCM token not configured")
         return False
     
     try:
-        notification_data = {
-            "title": "Test Push Notification",
-            "body": "This notification was sent from the PostgreSQL-integrated server!",
-            "metadata": {"sent_from": "test_script"},
-            "target_token": TEST_FCM_TOKEN
-        }
+        token_iter = iter(tokens or [TEST_FCM_TOKEN])
+        batches = list(iter(lambda: list(islice(token_iter, BATCH_SIZE)), []))
+        successful_sends = 0
+        failed_sends = 0
         
-        response = requests.post(f"{BASE_URL}/send-notification", 
-                               json=notification_data)
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Notification sent successfully")
-            print(f"   Status: {data['status']}")
-            print(f"   Successful sends: {data['successful_sends']}")
-            print(f"   Failed sends: {data['failed_sends']}")
-            return True
-        else:
-            print(f"❌ Notification sending failed: {response.status_code}")
-            print(f"   Response: {response.text}")
-            return False
+        # Batches are independent, so their FCM round-trips overlap; map keeps them in order
+        with ThreadPoolExecutor(max_workers=min(SEND_WORKERS, len(batches))) as executor:
+            responses = list(executor.map(send_batch, batches))
+        
+        for response in responses:
+            if response.status_code != 200:
+                log.info(f"❌ Notification sending failed: {response.status_code}")
+                log.info(f"   Response: {response_body(response)}")
+                return False
+            
+            data = json_body(response)
+            successful_sends += data['successful_sends']
+            failed_sends += data['failed_sends']
+        
+        log.info(f"✅ Notification sent successfully")
+        log.info(f"   Status: {'success' if successful_sends > 0 else 'error'}")
+        log.info(f"   Successful sends: {successful_sends}")
+        log.info(f"   Failed sends: {failed_sends}")
+        return True
     except Exception as e:
-        print(f"❌ Notification sending error: {e}")
+        log.info(f"❌ Notification sending error: {e}")
         return False
 
+# (name, test, names of tests that must pass first), listed so prerequisites come before dependents
+TESTS = [
+    ("health", test_health_bundle, []),
+    ("create", test_create_notification, ["health"]),
+    ("register", test_device_registration, ["health"]),
+    ("send", test_send_notification, ["register"]),
+]
+
+def run_after(test, prerequisites):
+    """Run a test once all its prerequisite futures have passed; return None if any failed"""
+    if all(prerequisite.result() for prerequisite in prerequisites):
+        return test()
+    return None
+
+def run_tests(tests=TESTS):
+    """Run independent tests concurrently and each dependent test as soon as its prerequisites pass"""
+    futures = {}
+    # One worker per test, so a test waiting on its prerequisites never starves them of a thread
+    with ThreadPoolExecutor(max_workers=len(tests)) as executor:
+        for name, test, dependencies in tests:
+            prerequisites = [futures[dependency] for dependency in dependencies]
+            futures[name] = executor.submit(run_after, test, prerequisites)
+    return {name: future.result() for name, future in futures.items()}
+
 def main():
     """Run all tests"""
-    print("=" * 60)
-    print("FCM Push Notification System - PostgreSQL Integration Test")
-    print("=" * 60)
+    log.info("=" * 60)
+    log.info("FCM Push Notification System - PostgreSQL Integration Test")
+    log.info("=" * 60)
     
-    # Test server status
-    if not test_server_status():
-        print("\n❌ Server is not running. Please start the Flask server first:")
-        print("   python app_with_postgres.py")
-        return
-    
-    # Test database
-    test_database_connection()
+    # Open a pooled connection before the first timed test
+    warm_up(BASE_URL)
     
-    # Test notifications
-    test_fetch_notifications()
+    results = run_tests()
     
-    # Test notification creation
-    new_notification_id = test_create_notification()
-    
-    # Test device registration and notification sending
-    if test_device_registration():
-        test_send_notification()
+    if not results["health"]:
+        log.info("\n❌ Health check failed. Make sure PostgreSQL is running and start the Flask server:")
+        log.info("   python app_with_postgres.py")
+        return
     
-    print("\n" + "=" * 60)
-    print("Test Summary:")
-    print("1. Update your .env file with correct database credentials")
-    print("2. Make sure PostgreSQL is running on port 5433")
-    print("3. Get your FCM token from the Android app and update TEST_FCM_TOKEN")
-    print("4. Run this test script to verify everything works")
-    print("\n🎉 PostgreSQL integration is ready for testing!")
-    print("=" * 60)
+    log.info("\n" + "=" * 60)
+    log.info("Test Summary:")
+    log.info("1. Update your .env file with correct database credentials")
+    log.info("2. Make sure PostgreSQL is running on port 5433")
+    log.info("3. Get your FCM token from the Android app and update TEST_FCM_TOKEN")
+    log.info("4. Run this test script to verify everything works")
+    log.info("\n🎉 PostgreSQL integration is ready for testing!")
+    log.info("=" * 60)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file